@@ -0,0 +1,399 @@
+"""Offline end-to-end benchmark of /download + /progress.
+
+Serves synthetic audio from a local HTTP server (yt-dlp's generic extractor
+takes direct media URLs), runs the Flask app on a local port in a child
+process, drives N jobs through it with C in flight at a time, and reports
+throughput, p50/p95/p99 time-to-complete, and the app process's peak RSS and
+thread count (plus the RSS of its conversion workers and FFmpeg processes).
+The load generator and media server stay in this process, so they are not
+counted; process figures need /proc (Linux). Results are written as JSON; `--baseline` compares them
+with an earlier run and exits with 1 on a regression beyond `--tolerance`.
+
+    python scripts/bench_download.py --jobs 40 --concurrency 8 --output bench.json
+    python scripts/bench_download.py --jobs 40 --concurrency 8 --baseline bench.json
+
+Needs FFmpeg (on PATH or --ffmpeg) for the conversions; no network access.
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# metric -> True when higher is better; used by --baseline
+COMPARED = {
+    "jobs_per_s": True,
+    "mb_per_s": True,
+    "p50_s": False,
+    "p95_s": False,
+    "p99_s": False,
+    "peak_rss_mb": False,
+    "peak_threads": False,
+}
+
+
+def synth_wav(seconds: float, rate: int = 44100) -> bytes:
+    """A stereo 16-bit sine sweep, so encoders get something less trivial than silence."""
+    frames = int(seconds * rate)
+    out = bytearray()
+    for i in range(frames):
+        t = i / rate
+        v = int(12000 * math.sin(2 * math.pi * (220 + 40 * (t % 5)) * t))
+        out += v.to_bytes(2, "little", signed=True) * 2
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(out))
+    return buf.getvalue()
+
+
+def media_server(payload: bytes, ext: str) -> ThreadingHTTPServer:
+    """Serves `payload` at /media-<n>.<ext> for any n: every job gets its own URL
+    (so the info and output caches do not turn the run into cache hits)."""
+    mime = {"wav": "audio/wav", "mp3": "audio/mpeg", "m4a": "audio/mp4", "mp4": "video/mp4", "webm": "video/webm"}.get(ext, "application/octet-stream")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self._send(body=False)
+
+        def do_GET(self):
+            self._send(body=True)
+
+        def _send(self, body: bool):
+            if not self.path.startswith("/media-"):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", mime)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            if body:
+                self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _proc_status(pid: int) -> dict:
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            return {k: v.strip() for k, _, v in (line.partition(":") for line in fh)}
+    except OSError:
+        return {}
+
+
+def _rss(status: dict) -> int:
+    return int(status.get("VmRSS", "0 kB").split()[0]) * 1024
+
+
+def _descendants(pid: int) -> list[int]:
+    """Processes below `pid` (the conversion pool workers and the FFmpeg they run), from /proc."""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as fh:
+                ppid = int(fh.read().rpartition(")")[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    out, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            out.append(child)
+            stack.append(child)
+    return out
+
+
+class ResourceSampler:
+    """Peak RSS and thread count of the app process `pid`, and peak RSS of
+    its descendants (the conversion pool), sampled every `interval` s.
+    Everything stays None where /proc is not available."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.supported = os.path.isdir(f"/proc/{pid}")
+        self.peak_rss = self.peak_children_rss = self.peak_threads = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        if not self.supported:
+            return
+        status = _proc_status(self.pid)
+        if not status:
+            return
+        children = sum(_rss(_proc_status(child)) for child in _descendants(self.pid))
+        self.peak_rss = max(self.peak_rss or 0, _rss(status))
+        self.peak_children_rss = max(self.peak_children_rss or 0, children)
+        self.peak_threads = max(self.peak_threads or 0, int(status.get("Threads", "0")))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def serve_app(workdir: str, env: dict, conn, stop) -> None:
+    """Child process: import the app in `workdir` with `env`, serve it on a
+    free local port (reported through `conn` with the pool sizes) until `stop` is set."""
+    os.chdir(workdir)
+    os.environ.update(env)
+    sys.path.insert(0, SRC)
+    import web_app
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+    server = make_server("127.0.0.1", 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn.send({"port": server.server_port, "workers": web_app.executor.workers,
+               "transcode_workers": web_app.converter.workers})
+    stop.wait()
+    server.shutdown()
+    web_app.converter.shutdown()  # exit hooks do not run in a multiprocessing child
+
+
+def run_job(base: str, url: str, fmt: str, bitrate: int, ffmpeg: str | None, timeout: float) -> dict:
+    """POST /download, then follow /progress until the job ends."""
+    t0 = time.perf_counter()
+    form = {"url": url, "format": fmt, "bitrate": str(bitrate)}
+    if ffmpeg:
+        form["ffmpeg"] = ffmpeg
+    req = urllib.request.Request(base + "/download", data=urllib.parse.urlencode(form).encode(),
+                                 headers={"X-Requested-With": "fetch"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        created = json.load(resp)
+    if created.get("status") != "ok":
+        return {"ok": False, "seconds": time.perf_counter() - t0, "error": created.get("message")}
+    result = {"ok": False, "error": "stream ended without a result"}
+    first_event = None
+    with urllib.request.urlopen(f"{base}/progress/{created['job_id']}", timeout=timeout) as stream:
+        for raw in stream:
+            line = raw.decode("utf-8", "replace").strip()
+            if not line.startswith("data:"):
+                continue
+            if first_event is None:
+                first_event = time.perf_counter() - t0
+            ev = json.loads(line[5:])
+            if ev.get("status") == "complete":
+                result = {"ok": True, "error": None, "cached": ev.get("cached", False),
+                          "timings": ev.get("timings") or {}}
+                break
+            if ev.get("status") == "error":
+                result = {"ok": False, "error": ev.get("message")}
+                break
+    return {**result, "seconds": time.perf_counter() - t0, "first_event_s": first_event}
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change of each compared metric; False if one regressed beyond `tolerance`."""
+    ok = True
+    print(f"\nvs. baseline {baseline.get('revision') or '?'} ({baseline.get('timestamp', '?')}):")
+    changed = sorted(k for k, v in result["config"].items() if baseline.get("config", {}).get(k) != v)
+    if changed:
+        print(f"  note: the runs differ in {', '.join(changed)}; the numbers are not directly comparable")
+    for key, higher_is_better in COMPARED.items():
+        new, old = result["results"].get(key), baseline.get("results", {}).get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        ok = ok and not flag
+        print(f"  {key:<14} {old:>10.3f} -> {new:>10.3f}  {change:+7.1%}  {flag}")
+    return ok
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--jobs", type=int, default=20, help="jobs to run (default 20)")
+    p.add_argument("--concurrency", type=int, default=4, help="jobs in flight at a time (default 4)")
+    p.add_argument("--seconds", type=float, default=30.0, help="length of the synthetic audio (default 30)")
+    p.add_argument("--source", help="serve this media file instead of the synthetic WAV (e.g. a video)")
+    p.add_argument("--format", default="mp3", choices=["mp3", "m4a"])
+    p.add_argument("--bitrate", type=int, default=128)
+    p.add_argument("--ffmpeg", help="FFmpeg binary or folder, if not on PATH")
+    p.add_argument("--workers", type=int, help="JOB_WORKERS for the app (default: its own)")
+    p.add_argument("--transcode-workers", type=int, help="TRANSCODE_WORKERS for the app")
+    p.add_argument("--warmup", type=int, default=1, help="jobs run first and not measured (default 1)")
+    p.add_argument("--timeout", type=float, default=300.0, help="per-job timeout in seconds")
+    p.add_argument("--output", default="bench-download.json", help="JSON results file")
+    p.add_argument("--baseline", help="earlier results file to compare with")
+    p.add_argument("--tolerance", type=float, default=0.10, help="allowed regression vs. baseline (default 0.10)")
+    args = p.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    if args.source:
+        with open(args.source, "rb") as fh:
+            payload = fh.read()
+        ext = os.path.splitext(args.source)[1].lstrip(".").lower() or "bin"
+    else:
+        payload, ext = synth_wav(args.seconds), "wav"
+    media = media_server(payload, ext)
+    media_base = f"http://127.0.0.1:{media.server_address[1]}"
+
+    # The app keeps downloads and caches under the working directory: use a scratch one,
+    # with the output cache off and room in the queue for every client. It runs in its own
+    # (spawned) process, so its RSS and threads can be measured apart from this harness
+    workdir = tempfile.mkdtemp(prefix="voxhub-bench-")
+    env = {"OUTPUT_CACHE_MB": "0", "JOB_QUEUE_SIZE": str(max(8, args.concurrency * 2))}
+    if args.workers:
+        env["JOB_WORKERS"] = str(args.workers)
+    if args.transcode_workers:
+        env["TRANSCODE_WORKERS"] = str(args.transcode_workers)
+    ctx = multiprocessing.get_context("spawn")
+    conn, child_conn = ctx.Pipe()
+    stop = ctx.Event()
+    # not daemonic: the app starts its own conversion worker processes
+    app_proc = ctx.Process(target=serve_app, args=(workdir, env, child_conn, stop))
+    app_proc.start()
+    if not conn.poll(120):
+        print("the app did not start", file=sys.stderr)
+        app_proc.terminate()
+        return 2
+    app = conn.recv()
+    base = f"http://127.0.0.1:{app['port']}"
+
+    def stop_app() -> None:
+        stop.set()
+        app_proc.join(30)
+        if app_proc.is_alive():
+            app_proc.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def job(i: int) -> dict:
+        return run_job(base, f"{media_base}/media-{i}.{ext}", args.format, args.bitrate, args.ffmpeg, args.timeout)
+
+    try:
+        for i in range(args.warmup):
+            warm = job(-1 - i)
+            if not warm["ok"]:
+                print(f"warmup job failed: {warm['error']}", file=sys.stderr)
+                return 2
+
+        with ResourceSampler(app_proc.pid) as sampler:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+                runs = list(pool.map(job, range(args.jobs)))
+            wall = time.perf_counter() - started
+    finally:
+        stop_app()
+        media.shutdown()
+
+    done = [r["seconds"] for r in runs if r["ok"]]
+    errors = sorted({r["error"] for r in runs if not r["ok"]})
+    first_bytes = [r["timings"]["first_byte_ms"] / 1000 for r in runs if r["ok"] and "first_byte_ms" in r["timings"]]
+    results = {
+        "completed": len(done),
+        "failed": len(runs) - len(done),
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(len(done) / wall, 3) if wall else 0.0,
+        "mb_per_s": round(len(done) * len(payload) / wall / 1e6, 3) if wall else 0.0,
+        "p50_s": percentile(done, 50),
+        "p95_s": percentile(done, 95),
+        "p99_s": percentile(done, 99),
+        "max_s": max(done) if done else None,
+        "first_byte_p50_s": percentile(first_bytes, 50),
+        "peak_rss_mb": round(sampler.peak_rss / 1e6, 1) if sampler.peak_rss is not None else None,
+        "peak_workers_rss_mb": round(sampler.peak_children_rss / 1e6, 1) if sampler.peak_children_rss is not None else None,
+        "peak_threads": sampler.peak_threads,
+        "errors": errors[:10],
+    }
+    for key in ("p50_s", "p95_s", "p99_s", "max_s", "first_byte_p50_s"):
+        if results[key] is not None:
+            results[key] = round(results[key], 3)
+    import yt_dlp.version
+
+    report = {
+        "benchmark": "download",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "yt_dlp": yt_dlp.version.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "jobs": args.jobs,
+            "concurrency": args.concurrency,
+            "format": args.format,
+            "bitrate": args.bitrate,
+            "source": os.path.basename(args.source) if args.source else f"synthetic wav {args.seconds:g}s",
+            "source_bytes": len(payload),
+            "workers": app["workers"],
+            "transcode_workers": app["transcode_workers"],
+        },
+        "results": results,
+    }
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=2)
+
+    print(f"{results['completed']}/{args.jobs} jobs in {results['wall_s']} s "
+          f"({results['jobs_per_s']} jobs/s, {results['mb_per_s']} MB/s of source)")
+    print(f"time to complete: p50 {results['p50_s']} s, p95 {results['p95_s']} s, p99 {results['p99_s']} s")
+    print(f"app process: peak RSS {results['peak_rss_mb']} MB (+{results['peak_workers_rss_mb']} MB in "
+          f"conversion workers and FFmpeg), peak threads {results['peak_threads']}")
+    for err in errors:
+        print(f"error: {err}", file=sys.stderr)
+    print(f"results: {output}")
+    if baseline is not None and not compare(report, baseline, args.tolerance):
+        return 1
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
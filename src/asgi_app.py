@@ -0,0 +1,207 @@
+"""Async (ASGI) serving mode.
+
+`/progress/<job_id>` streams and `/transcribe` are served natively on the event
+loop, so an idle SSE subscriber or a pending model call costs a coroutine
+instead of an OS thread. yt-dlp/FFmpeg work still runs on the job pools from
+`web_app`, and every other route is the regular Flask app behind WsgiToAsgi.
+
+Run with:  uvicorn asgi_app:app --app-dir src --host 0.0.0.0 --port 5000
+or simply: python src/asgi_app.py
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+# Ensure current directory is in path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import Headers
+from werkzeug.formparser import parse_form_data
+
+import tracing
+import web_app
+from transcription import atranscribe_bytes
+
+flask_app = WsgiToAsgi(web_app.app)
+
+
+async def _send_json(send, payload: dict, status: int = 200, headers: list | None = None) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _read_body(receive, limit: int) -> bytes | None:
+    """The request body, or None if the client disconnected before sending it
+    all. Raises _BodyTooLarge as soon as it grows past `limit` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return None
+        chunk = msg.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+
+def _parse_form(body: bytes, content_type: str):
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    _, form, files = parse_form_data(environ)
+    return form, files
+
+
+async def progress(scope, receive, send, job_id: str) -> None:
+    headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+    # a shared job store does blocking I/O here
+    job, q, busy = await asyncio.to_thread(web_app._open_progress, job_id)
+    if busy:
+        return await _send_json(send, {"status": "busy", "message": web_app.BUSY_MESSAGE}, 429,
+                                headers=[(b"retry-after", b"10")])
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+    })
+
+    async def emit(text: str) -> None:
+        await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+    async def stream() -> None:
+        if q is None:
+            await emit(web_app._sse({"status": "error", "message": "Job não encontrado."}))
+            return
+        last_event_id = web_app._last_event_id(headers.get("Last-Event-ID"))
+        if last_event_id is None:
+            await emit("retry: 3000\n" + web_app._sse({"status": "start"}))
+        async for item in q.aevents(last_event_id):
+            if item is None:
+                # heartbeat
+                await emit(":\n\n")
+                continue
+            await emit(web_app._sse(item[1], item[0]))
+        final = await asyncio.to_thread(web_app.jobs.get, job_id)
+        await emit(web_app._sse(web_app._final_event(final or job)))
+
+    # Stop streaming as soon as the client goes away instead of at the next heartbeat
+    task = asyncio.ensure_future(stream())
+
+    async def watch_disconnect() -> None:
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                task.cancel()
+                return
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await task
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    except asyncio.CancelledError:
+        pass
+    finally:
+        watcher.cancel()
+
+
+async def transcribe(scope, receive, send) -> None:
+    unavailable = web_app._transcribe_unavailable()
+    if unavailable:
+        return await _send_json(send, unavailable[0], unavailable[1])
+
+    headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+    too_large = web_app._upload_too_large()
+    if web_app._content_length(headers) > web_app.TRANSCRIBE_MAX_UPLOAD:
+        return await _send_json(send, too_large, 413)
+    try:
+        body = await _read_body(receive, web_app.TRANSCRIBE_MAX_UPLOAD)
+    except _BodyTooLarge:
+        return await _send_json(send, too_large, 413)
+    if body is None:
+        return  # the client went away: nobody to answer
+    # Parsing the form and reading the upload copy the whole file: keep them off the loop
+    form, files = await asyncio.to_thread(_parse_form, body, headers.get("Content-Type", ""))
+    f = files.get("audio")
+    if not f:
+        return await _send_json(send, {"status": "error", "message": "Envie um arquivo de áudio ou use a gravação."}, 400)
+
+    # Spans are traced like the Flask route; there is no per-request profile here, since
+    # cProfile on the event loop would mix in every other request it serves
+    request_id = web_app._request_id(headers)
+    rid_header = [(b"x-request-id", request_id.encode())]
+    try:
+        with tracing.trace(request_id, kind="transcribe"), tracing.span("transcribe"):
+            audio_bytes, mime = await asyncio.to_thread(web_app._read_upload, f)
+            params = web_app._transcribe_params(form, headers)
+            model_name, prompt = params.pop("model_name"), params.pop("prompt")
+            # Cache lookup and FFmpeg normalization are short blocking steps: keep them off the loop
+            with tracing.span("prepare", bytes=len(audio_bytes)) as s:
+                ctx = await asyncio.to_thread(
+                    web_app._transcribe_prepare, audio_bytes, mime, model_name, prompt,
+                    suffix=os.path.splitext(f.filename or "")[1], **params,
+                )
+                s.set(cached=ctx["result"]["cached"], payload_bytes=len(ctx["payload"]))
+            if not ctx["result"]["cached"]:
+                # builds the client (under a lock) on first use or after a key change
+                client, setup_s = await asyncio.to_thread(web_app.genai_client.get, web_app._transcription_key())
+                t0 = time.perf_counter()
+                with tracing.span("model", model=model_name, long=ctx["long"]):
+                    if ctx["long"]:
+                        text = await asyncio.to_thread(web_app._transcribe_long_ctx, client, ctx)
+                    else:
+                        text = await atranscribe_bytes(client, model_name, ctx["payload"], ctx["mime"], prompt,
+                                                       web_app._fallback_hook(ctx))
+                await asyncio.to_thread(web_app._transcribe_finish, ctx, text, setup_s, t0)
+        await _send_json(send, {"status": "ok", "request_id": request_id, **ctx["result"]}, headers=rid_header)
+    except Exception as e:
+        await _send_json(send, {"status": "error", "message": str(e), "request_id": request_id}, 500, headers=rid_header)
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    path, method = scope["path"], scope["method"]
+    if method == "GET" and path.startswith("/progress/"):
+        return await progress(scope, receive, send, path[len("/progress/"):])
+    if method == "POST" and path == "/transcribe":
+        return await transcribe(scope, receive, send)
+    await flask_app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    host = os.environ.get("HOST", "127.0.0.1")
+    try:
+        port = int(os.environ.get("PORT", "5000"))
+    except Exception:
+        port = 5000
+    uvicorn.run(app, host=host, port=port, timeout_keep_alive=75)
@@ -0,0 +1,101 @@
+import subprocess
+import tempfile
+from typing import Iterator
+
+# Protocols FFmpeg can read by itself; other sources (DASH fragments, ...) need the job pipeline
+STREAMABLE_PROTOCOLS = ("http", "https", "m3u8", "m3u8_native")
+
+# Output settings per format. m4a is written as fragmented MP4 so it can be
+# played while it grows (a regular MP4 needs its index at the end).
+STREAM_FORMATS = {
+    "mp3": {"codec": "libmp3lame", "copy_if": ("mp3",), "args": ["-f", "mp3"], "mime": "audio/mpeg"},
+    "m4a": {
+        "codec": "aac",
+        "copy_if": ("mp4a", "aac"),
+        "args": ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"],
+        "mime": "audio/mp4",
+    },
+}
+
+
+def stream_source(info: dict) -> dict | None:
+    """The selected format of an `extract_info(download=False)` result, if FFmpeg can read it directly."""
+    fmt = info
+    if info.get("requested_formats"):
+        audio = [f for f in info["requested_formats"] if f.get("acodec") not in (None, "none")]
+        fmt = audio[0] if audio else info["requested_formats"][0]
+    if not fmt.get("url") or fmt.get("protocol", "https") not in STREAMABLE_PROTOCOLS:
+        return None
+    return fmt
+
+
+def stream_command(source: dict, audio_format: str, bitrate: int, ffmpeg: str = "ffmpeg") -> list[str]:
+    """FFmpeg command that reads `source` (a yt-dlp format dict) and writes the encoded audio to stdout."""
+    spec = STREAM_FORMATS[audio_format]
+    headers = "".join(f"{k}: {v}\r\n" for k, v in (source.get("http_headers") or {}).items())
+    cmd = [ffmpeg, "-v", "error", "-nostdin"]
+    if source.get("protocol", "https").startswith("http"):
+        cmd += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5", "-rw_timeout", "15000000"]
+    if headers:
+        cmd += ["-headers", headers]
+    cmd += ["-i", source["url"], "-vn"]
+    acodec = (source.get("acodec") or "").lower()
+    if acodec.startswith(spec["copy_if"]):
+        # same codec as requested: remux only, like FFmpegExtractAudio does
+        cmd += ["-c:a", "copy"]
+    else:
+        cmd += ["-c:a", spec["codec"]]
+        if audio_format == "mp3" and bitrate:
+            cmd += ["-b:a", f"{int(bitrate)}k"]
+    return cmd + spec["args"] + ["pipe:1"]
+
+
+class EncodedStream:
+    """Stdout of a running FFmpeg as an iterable of chunks, for a streaming response.
+
+    Created by `stream_encoded`. `close()` (called by the WSGI server when the
+    response ends or the client goes away, even if iteration never started)
+    kills FFmpeg if it is still running.
+    """
+
+    def __init__(self, proc: subprocess.Popen, first: bytes, chunk_size: int, stderr):
+        self.proc = proc
+        self.stderr = stderr
+        self.first = first
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.first
+        while True:
+            chunk = self.proc.stdout.read1(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        self.proc.wait()
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.stderr.close()
+
+
+def stream_encoded(cmd: list[str], chunk_size: int = 64 * 1024) -> EncodedStream:
+    """Start `cmd` and return its output as an `EncodedStream`.
+
+    The first chunk is read before this returns, so a source FFmpeg cannot
+    open raises RuntimeError while the caller can still send an error status.
+    """
+    # stderr goes to a file: an undrained pipe would block FFmpeg once it fills up
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+    first = proc.stdout.read1(chunk_size)
+    if not first:
+        proc.wait()
+        proc.stdout.close()
+        stderr.seek(0)
+        lines = stderr.read().decode("utf-8", "replace").strip().splitlines()
+        stderr.close()
+        raise RuntimeError(lines[-1] if lines else "ffmpeg não produziu áudio")
+    return EncodedStream(proc, first, chunk_size, stderr)
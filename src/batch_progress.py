@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+
+# "skipped": a playlist entry whose output was already on disk
+TERMINAL_STATUSES = ("complete", "error", "skipped")
+
+
+class BatchProgress:
+    """Aggregated state of the download jobs of one batch.
+
+    Every event of an item job goes through `update`, which returns the event
+    for the batch's own progress stream: "downloading" updates become a batch
+    "downloading" event (the channel coalesces those, and each one carries the
+    whole picture, so dropping older ones loses nothing); every other item
+    event becomes an "item" event. Both carry `summary()`: per-item status and
+    progress, overall progress, current speed, average throughput and failures.
+
+    The batch also decides which items run: at most `parallel` at a time, the
+    next one starting when an item finishes, so a large batch never floods the
+    job queue. Items given with `"status": "skipped"` count as done from the
+    start and never run.
+    """
+
+    def __init__(self, items: list[dict], parallel: int = 2):
+        self.parallel = max(1, int(parallel))
+        self._lock = threading.Lock()
+        self._items = []
+        for it in items:
+            item = {"job_id": it["job_id"], "url": it.get("url", ""), "status": it.get("status", "pending"),
+                    "pct": 0.0, "downloaded": 0, "speed": 0.0}
+            if item["status"] in TERMINAL_STATUSES:
+                item["pct"] = 100.0
+                item.update({k: it[k] for k in ("message", "file_url") if it.get(k)})
+            self._items.append(item)
+        self._by_id = {it["job_id"]: it for it in self._items}
+        self._waiting = deque(it["job_id"] for it in self._items)
+        self._active: set[str] = set()
+        self._started = time.monotonic()
+        self._closed = False
+
+    def next_to_start(self) -> list[str]:
+        """Items to submit now, marked active; empty when enough are running."""
+        with self._lock:
+            out = []
+            while self._waiting and len(self._active) < self.parallel:
+                job_id = self._waiting.popleft()
+                if self._by_id[job_id]["status"] in TERMINAL_STATUSES:
+                    continue
+                self._active.add(job_id)
+                out.append(job_id)
+            return out
+
+    def requeue(self, job_id: str) -> bool:
+        """Put an item that could not be submitted back in front of the line.
+
+        Returns False when nothing else of this batch is running, i.e. no
+        finishing item would ever retry it.
+        """
+        with self._lock:
+            self._active.discard(job_id)
+            if not self._active:
+                return False
+            self._waiting.appendleft(job_id)
+            return True
+
+    def update(self, job_id: str, ev: dict) -> dict | None:
+        """Record an item event; returns the matching batch event (None for unknown items)."""
+        with self._lock:
+            item = self._by_id.get(job_id)
+            if item is None or item["status"] in TERMINAL_STATUSES:
+                return None
+            status = "skipped" if ev.get("skipped") else ev.get("status") or item["status"]
+            item["status"] = status
+            if status == "downloading":
+                item["pct"] = round(float(ev.get("pct") or 0.0), 1)
+                item["downloaded"] = int(ev.get("downloaded") or 0)
+                item["speed"] = float(ev.get("speed") or 0.0)
+                return {"status": "downloading", **self._summary()}
+            item["speed"] = 0.0
+            if status == "finished":
+                item["pct"] = 100.0
+            elif status in TERMINAL_STATUSES:
+                self._active.discard(job_id)
+                item["pct"] = 100.0
+                item["message"] = ev.get("message", "")
+                if ev.get("file_url"):
+                    item["file_url"] = ev["file_url"]
+            out = {"status": "item", "job_id": job_id, "index": self._items.index(item), "item_status": status}
+            if status == "queued":
+                out["position"] = ev.get("position")
+            return {**out, **self._summary()}
+
+    def close(self) -> bool:
+        """True exactly once, when every item is complete or failed."""
+        with self._lock:
+            if self._closed or any(it["status"] not in TERMINAL_STATUSES for it in self._items):
+                return False
+            self._closed = True
+            return True
+
+    def summary(self) -> dict:
+        with self._lock:
+            return self._summary()
+
+    def _summary(self) -> dict:
+        # caller holds the lock
+        total = len(self._items)
+        elapsed = time.monotonic() - self._started
+        downloaded = sum(it["downloaded"] for it in self._items)
+        return {
+            "total": total,
+            "processed": sum(1 for it in self._items if it["status"] in TERMINAL_STATUSES),
+            "completed": sum(1 for it in self._items if it["status"] == "complete"),
+            "failed": sum(1 for it in self._items if it["status"] == "error"),
+            "skipped": sum(1 for it in self._items if it["status"] == "skipped"),
+            "active": len(self._active),
+            "pct": round(sum(it["pct"] for it in self._items) / total, 1) if total else 100.0,
+            "downloaded": downloaded,
+            "speed": round(sum(it["speed"] for it in self._items if it["status"] == "downloading")),
+            "throughput": round(downloaded / elapsed) if elapsed > 0 else 0,
+            "elapsed": round(elapsed, 1),
+            "items": [{k: v for k, v in it.items() if k not in ("downloaded", "speed")} for it in self._items],
+        }
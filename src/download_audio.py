@@ -1,7 +1,11 @@
 import argparse
+import multiprocessing
 import os
+import queue
 import sys
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from yt_dlp import YoutubeDL
 
 
@@ -69,6 +73,126 @@ def progress_hook(d):
         print("\nDownload finished, extracting/converting audio...")
 
 
+def _progress_line(d) -> str:
+    total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+    downloaded = d.get("downloaded_bytes", 0) or 0
+    speed = d.get("speed") or 0
+    pct = (downloaded / total * 100) if total else 0.0
+    spd_str = _format_bytes(speed) + "/s" if speed else "--"
+    return f"[{_bar(pct, 20)}] {pct:5.1f}%  {spd_str:>11}  ETA {_format_eta(d.get('eta'))}"
+
+
+def _download_one(index: int, url: str, opts: dict, events) -> tuple[int, str, str | None]:
+    """Worker for --jobs: downloads one URL and reports progress through `events`."""
+    def hook(d):
+        status = d.get("status")
+        if status == "downloading":
+            events.put((index, "downloading", _progress_line(d)))
+        elif status == "finished":
+            events.put((index, "converting", "converting audio..."))
+
+    job_opts = dict(opts)
+    job_opts["progress_hooks"] = [hook]
+    job_opts["noprogress"] = True
+    try:
+        with YoutubeDL(job_opts) as ydl:
+            retcode = ydl.download([url])
+        if retcode:
+            raise RuntimeError(f"yt-dlp exited with code {retcode}")
+        events.put((index, "done", "done"))
+        return index, url, None
+    except Exception as e:
+        events.put((index, "failed", f"failed: {e}"))
+        return index, url, str(e)
+
+
+class MultiProgress:
+    """Multi-line progress display for parallel downloads.
+
+    On a terminal, one line per running download plus a totals line are
+    redrawn in place; otherwise only start/finish/failure lines are printed.
+    """
+
+    def __init__(self, urls: list[str], stream=None):
+        self.urls = urls
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.lines: dict[int, str] = {}
+        self.done = 0
+        self.failed = 0
+        self._drawn = 0
+
+    def _label(self, index: int) -> str:
+        url = self.urls[index]
+        return url if len(url) <= 48 else url[:45] + "..."
+
+    def update(self, index: int, state: str, text: str) -> None:
+        if state in ("done", "failed"):
+            self.lines.pop(index, None)
+            if state == "done":
+                self.done += 1
+            else:
+                self.failed += 1
+            if self.tty:
+                self._clear()
+            print(f"[{index + 1}/{len(self.urls)}] {self._label(index)}: {text}", file=self.stream)
+        else:
+            if index not in self.lines and not self.tty:
+                print(f"[{index + 1}/{len(self.urls)}] {self._label(index)}: started", file=self.stream)
+            self.lines[index] = text
+        if self.tty:
+            self._redraw()
+
+    def _clear(self) -> None:
+        if self._drawn:
+            # move to the first drawn line and erase everything below it
+            self.stream.write(f"\x1b[{self._drawn}F\x1b[J")
+            self._drawn = 0
+
+    def _redraw(self) -> None:
+        self._clear()
+        rows = [f"  {i + 1:>3} {self._label(i)}  {text}" for i, text in sorted(self.lines.items())]
+        rows.append(f"  {self.done + self.failed}/{len(self.urls)} finished, {self.failed} failed")
+        self.stream.write("\n".join(rows) + "\n")
+        self.stream.flush()
+        self._drawn = len(rows)
+
+
+def download_parallel(urls: list[str], opts: dict, jobs: int) -> list[tuple[str, str | None]]:
+    """Download `urls` in a process pool. Returns (url, error) per URL, in input order."""
+    display = MultiProgress(urls)
+    results: list[tuple[str, str | None]] = [(u, None) for u in urls]
+    with multiprocessing.Manager() as manager:
+        events = manager.Queue()
+        stop = threading.Event()
+
+        def pump():
+            while not stop.is_set() or not events.empty():
+                try:
+                    index, state, text = events.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                display.update(index, state, text)
+
+        printer = threading.Thread(target=pump, daemon=True)
+        printer.start()
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(_download_one, i, url, opts, events) for i, url in enumerate(urls)]
+                for fut in as_completed(futures):
+                    try:
+                        index, url, error = fut.result()
+                    except Exception as e:  # worker process died
+                        index = futures.index(fut)
+                        url, error = urls[index], str(e)
+                        events.put((index, "failed", f"failed: {e}"))
+                    results[index] = (url, error)
+        finally:
+            stop.set()
+            printer.join()
+    return results
+
+
 def build_opts(outdir: str, audio_format: str, bitrate: int, no_playlist: bool, outtmpl: str | None, cookiefile: str | None, ffmpeg_location: str | None):
     postprocessors = []
     # Support 'mp4' as an alias for 'm4a' to match user expectation
@@ -121,6 +245,30 @@ def build_opts(outdir: str, audio_format: str, bitrate: int, no_playlist: bool,
     return opts
 
 
+def split_postprocessors(opts: dict) -> tuple[dict, list[dict]]:
+    """Split options into a download-only copy (raw bestaudio, no FFmpeg) and
+    the postprocessors to run afterwards with `convert_audio`."""
+    download_opts = dict(opts)
+    postprocessors = download_opts.pop("postprocessors", None) or []
+    download_opts["postprocessors"] = []
+    if postprocessors:
+        download_opts["format"] = "bestaudio/best"
+    return download_opts, postprocessors
+
+
+def convert_audio(filepath: str, postprocessors: list[dict], ffmpeg_location: str | None = None) -> str:
+    """Run the FFmpeg postprocessors from `build_opts` on an already downloaded
+    file and return the converted file path. The source file is removed."""
+    opts = {"quiet": True, "no_warnings": True, "postprocessors": postprocessors}
+    if ffmpeg_location:
+        opts["ffmpeg_location"] = ffmpeg_location
+    base, ext = os.path.splitext(filepath)
+    info = {"id": os.path.basename(base), "title": os.path.basename(base), "ext": ext.lstrip(".")}
+    with YoutubeDL(opts) as ydl:
+        info = ydl.post_process(filepath, info)
+    return info["filepath"]
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Download videos and extract audio as MP3 or M4A."
@@ -168,6 +316,13 @@ def main():
         default=None,
         help="Path to FFmpeg binary or directory containing it (e.g., tools/ffmpeg/bin)",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of URLs to download and convert in parallel (default: 1)",
+    )
 
     args = parser.parse_args()
     os.makedirs(args.output, exist_ok=True)
@@ -189,6 +344,15 @@ def main():
         cookiefile=args.cookies,
         ffmpeg_location=ffmpeg_loc,
     )
+    if args.jobs > 1 and len(args.urls) > 1:
+        results = download_parallel(args.urls, ydl_opts, min(args.jobs, len(args.urls)))
+        failed = [(url, err) for url, err in results if err]
+        print("\nSummary:")
+        for url, err in results:
+            print(f"  {'FAIL' if err else 'OK  '}  {url}" + (f"  ({err})" if err else ""))
+        print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed. Files saved to: {os.path.abspath(args.output)}")
+        sys.exit(1 if failed else 0)
+
     try:
         with YoutubeDL(ydl_opts) as ydl:
             for url in args.urls:
@@ -0,0 +1,107 @@
+import threading
+
+from rate_limit import host_key
+
+# Protocols yt-dlp downloads as many fragments (where concurrency helps)
+FRAGMENTED_PROTOCOLS = ("m3u8_native", "http_dash_segments", "dash_frag_urls", "ism")
+
+MIN_CHUNK = 1 << 20
+MAX_CHUNK = 32 << 20
+
+
+def _pow2(n: float) -> int:
+    return 1 << max(0, int(n).bit_length() - 1)
+
+
+class _HostTuning:
+    def __init__(self, concurrency: int, chunk_size: int):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.per_conn: float | None = None  # EWMA of bytes/s per connection
+        self.best_per_conn = 0.0
+        self.last_total = 0.0
+        self.samples = 0
+        self.backoffs = 0
+
+
+class DownloadTuner:
+    """Picks yt-dlp's fragment concurrency and HTTP chunk size per upstream
+    host from the throughput earlier jobs measured.
+
+    Every finished download reports (bytes, seconds, settings) to `record`.
+    Concurrency grows by one while total throughput keeps improving and is
+    halved when throughput per connection falls below `backoff` of the best
+    seen for the host (the host or the link is saturated). The chunk size
+    follows per-connection throughput so each ranged request carries about
+    `chunk_seconds` of data, within 1-32 MiB. `choose` returns the yt-dlp
+    options for the next job on that host.
+    """
+
+    def __init__(self, max_concurrency: int = 8, start_concurrency: int = 2, chunk_seconds: float = 4.0,
+                 start_chunk: int = 10 << 20, alpha: float = 0.3, backoff: float = 0.6):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.start_concurrency = min(self.max_concurrency, max(1, int(start_concurrency)))
+        self.chunk_seconds = chunk_seconds
+        self.start_chunk = start_chunk
+        self.alpha = alpha
+        self.backoff = backoff
+        self._hosts: dict[str, _HostTuning] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> _HostTuning:
+        # caller holds the lock
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostTuning(self.start_concurrency, self.start_chunk)
+        return state
+
+    def choose(self, info: dict) -> dict:
+        """Settings for downloading `info` (an extract_info result): host,
+        whether it is fragmented, and the yt-dlp options to apply."""
+        fmt = info
+        if info.get("requested_formats"):
+            fmt = next((f for f in info["requested_formats"] if f.get("acodec") not in (None, "none")),
+                       info["requested_formats"][0])
+        host = host_key(fmt.get("fragment_base_url") or fmt.get("manifest_url") or fmt.get("url") or info.get("webpage_url") or "")
+        fragmented = (fmt.get("protocol") or "").split("+")[0] in FRAGMENTED_PROTOCOLS
+        with self._lock:
+            state = self._state(host)
+            return {
+                "host": host,
+                "fragmented": fragmented,
+                "concurrent_fragment_downloads": state.concurrency if fragmented else 1,
+                "http_chunk_size": state.chunk_size,
+            }
+
+    def record(self, tuning: dict, downloaded: int, elapsed: float) -> None:
+        """Feed back one finished download made with `tuning` (from `choose`)."""
+        if not downloaded or not elapsed or elapsed <= 0:
+            return
+        total = downloaded / elapsed
+        conns = tuning.get("concurrent_fragment_downloads", 1) if tuning.get("fragmented") else 1
+        per_conn = total / max(1, conns)
+        with self._lock:
+            state = self._state(tuning["host"])
+            state.samples += 1
+            state.per_conn = per_conn if state.per_conn is None else (1 - self.alpha) * state.per_conn + self.alpha * per_conn
+            state.best_per_conn = max(state.best_per_conn, state.per_conn)
+            if tuning.get("fragmented") and conns == state.concurrency:
+                if state.per_conn < self.backoff * state.best_per_conn and state.concurrency > 1:
+                    state.concurrency = max(1, state.concurrency // 2)
+                    state.backoffs += 1
+                    # measure again from here instead of against the old peak
+                    state.best_per_conn = state.per_conn
+                elif total >= state.last_total and state.concurrency < self.max_concurrency:
+                    state.concurrency += 1
+                state.last_total = total
+            state.chunk_size = min(MAX_CHUNK, max(MIN_CHUNK, _pow2(state.per_conn * self.chunk_seconds)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {host: {
+                "concurrent_fragments": s.concurrency,
+                "chunk_size": s.chunk_size,
+                "per_connection_bps": round(s.per_conn or 0),
+                "samples": s.samples,
+                "backoffs": s.backoffs,
+            } for host, s in self._hosts.items()}
@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+# Stream URLs are refreshed this many seconds before the site says they expire
+EXPIRY_MARGIN = 60
+
+
+def stream_expiry(info: dict) -> float | None:
+    """Earliest `expire=` timestamp found in the stream URLs of an info dict."""
+    urls = []
+    for f in (info.get("requested_formats") or []) + (info.get("formats") or []):
+        if f.get("url"):
+            urls.append(f["url"])
+    if info.get("url"):
+        urls.append(info["url"])
+    earliest = None
+    for u in urls:
+        try:
+            values = parse_qs(urlparse(u).query).get("expire")
+            ts = float(values[0]) if values else None
+        except (ValueError, TypeError):
+            ts = None
+        if ts and (earliest is None or ts < earliest):
+            earliest = ts
+    return earliest
+
+
+class InfoCache:
+    """TTL cache for `extract_info(download=False)` results.
+
+    Entries live in a small in-memory LRU and, when `db_path` is set, in a
+    sqlite table shared between restarts/processes. Info dicts are stored as
+    JSON so every `get` returns a fresh copy that callers may mutate (yt-dlp's
+    `process_ie_result` does). An entry never outlives the `expire=` stamp of
+    its stream URLs.
+    """
+
+    def __init__(self, ttl: float = 1800.0, max_entries: int = 256, db_path: str | None = None):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        if self.enabled and db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS info_cache (key TEXT PRIMARY KEY, expires REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT expires, data FROM info_cache WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self._mem.move_to_end(key)
+            self.hits += 1
+            data = entry[1]
+        return json.loads(data)
+
+    def put(self, key: str, info: dict) -> None:
+        if not self.enabled or not info:
+            return
+        expires = time.time() + self.ttl
+        stream_exp = stream_expiry(info)
+        if stream_exp is not None:
+            expires = min(expires, stream_exp - EXPIRY_MARGIN)
+        if expires <= time.time():
+            return
+        data = json.dumps(info, default=str)
+        with self._lock:
+            self._remember(key, (expires, data))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO info_cache (key, expires, data) VALUES (?, ?, ?)",
+                    (key, expires, data),
+                )
+                self._db.execute("DELETE FROM info_cache WHERE expires <= ?", (time.time(),))
+                self._db.commit()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._forget(key)
+            self.refreshes += 1
+
+    def _remember(self, key: str, entry: tuple[float, str]) -> None:
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        self._mem.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM info_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._mem),
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "refreshes": self.refreshes,
+            }
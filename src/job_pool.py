@@ -0,0 +1,181 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+
+class JobExecutor:
+    """Fixed-size pool of worker threads fed by a bounded pending queue.
+
+    Workers are started lazily on the first submit so that importing the app
+    (e.g. on serverless platforms) does not spawn threads.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8, name: str = "job-worker"):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(0, int(max_pending))
+        self.name = name
+        self._pending: queue.Queue = queue.Queue()
+        # jobs admitted at once: one per worker plus the queue (at least one slot, as before)
+        self.capacity = self.workers + max(1, self.max_pending)
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._active = 0
+        self._inflight = 0  # submitted and not finished
+        self._reserved = 0  # slots held by reserve() for an upcoming submit
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self) -> None:
+        while True:
+            fn, args, on_start, announced = self._pending.get()
+            with self._lock:
+                self._active += 1
+            try:
+                if on_start is not None:
+                    announced.wait()  # the job's on_queued has run
+                    on_start()
+                fn(*args)
+            except Exception:
+                # Job functions report their own errors; never let a worker die
+                pass
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._inflight -= 1
+                self._pending.task_done()
+
+    def _full(self) -> bool:
+        # caller holds the lock
+        return self._inflight + self._reserved >= self.capacity
+
+    def is_full(self) -> bool:
+        """True when every worker is busy and the pending queue has no free slot."""
+        with self._lock:
+            return self._full()
+
+    def reserve(self) -> bool:
+        """Hold a slot for a job about to be submitted with `reserved=True`;
+        False if there is none. `release()` gives back a slot left unused."""
+        with self._lock:
+            if self._full():
+                return False
+            self._reserved += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._reserved = max(0, self._reserved - 1)
+
+    def submit(self, fn: Callable, *args, on_start: Callable | None = None,
+               on_queued: Callable[[int], None] | None = None, reserved: bool = False) -> int | None:
+        """Enqueue a job. Returns its position in the pending queue (0 when a
+        worker is expected to pick it up right away) or None if the queue is
+        full; a `reserved` submit uses the slot taken by `reserve()` and always
+        gets in.
+
+        `on_queued(position)` is called after the job is queued, outside the
+        lock, and always before `on_start`: the worker that takes the job
+        waits until it has returned.
+        """
+        self._ensure_started()
+        announced = threading.Event()
+        with self._lock:
+            if reserved:
+                self._reserved = max(0, self._reserved - 1)
+            elif self._full():
+                return None
+            position = max(0, self._inflight - self.workers + 1)
+            self._inflight += 1
+            self._pending.put_nowait((fn, args, on_start, announced))
+        try:
+            if on_queued is not None:
+                on_queued(position)
+        finally:
+            announced.set()
+        return position
+
+    def pending(self) -> int:
+        return self._pending.qsize()
+
+    def active(self) -> int:
+        with self._lock:
+            return self._active
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "active": self.active(),
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+        }
+
+
+class ConversionPool:
+    """CPU stage of the pipeline: a process pool sized to the machine's cores.
+
+    The process pool is created on first use. Since a ProcessPoolExecutor
+    cannot tell which tasks are running, active/pending are derived from the
+    number of tasks in flight.
+
+    If a worker dies (OOM kill, crash) the executor is broken for good; the
+    tasks it had fail with BrokenProcessPool and the next submit builds a
+    new one.
+    """
+
+    def __init__(self, workers: int | None = None):
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._inflight = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, fn: Callable, *args) -> tuple[Future, int]:
+        """Schedule `fn(*args)` in a worker process. Returns the future and the
+        number of conversions queued ahead of it."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+            try:
+                fut = self._pool.submit(fn, *args)
+            except BrokenProcessPool:
+                # a worker died: drop the broken executor and retry once on a fresh one
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                fut = self._pool.submit(fn, *args)
+            position = max(0, self._inflight - self.workers + 1)
+            self._inflight += 1
+        fut.add_done_callback(self._task_done)
+        return fut, position
+
+    def _task_done(self, _fut: Future) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = self._inflight
+        return {
+            "workers": self.workers,
+            "active": min(inflight, self.workers),
+            "pending": max(0, inflight - self.workers),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker processes. Only needed where the interpreter's exit
+        hooks do not run, e.g. an app served from a multiprocessing child."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+FINISHED_STATUSES = ("done", "error")
+
+
+class JobRegistry:
+    """Thread-safe store for web jobs with bounded size and TTL eviction.
+
+    - finished jobs (done/error) are dropped `ttl` seconds after finishing;
+    - jobs still "pending" (their /progress stream was never opened) are
+      reaped `pending_ttl` seconds after creation;
+    - when `max_entries` is reached, the oldest evictable jobs go first.
+      Queued/running jobs are never evicted.
+
+    Sweeps happen inline on writes, so no background thread is needed.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 600.0, pending_ttl: float = 300.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.pending_ttl = float(pending_ttl)
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.reaped_pending = 0
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def __contains__(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def __setitem__(self, job_id: str, job: dict) -> None:
+        self.add(job_id, job)
+
+    def add(self, job_id: str, job: dict) -> None:
+        now = time.time()
+        job.setdefault("created_at", now)
+        with self._lock:
+            self._sweep(now)
+            if len(self._jobs) >= self.max_entries:
+                self._evict_oldest(len(self._jobs) - self.max_entries + 1)
+            self._jobs[job_id] = job
+
+    def values(self) -> list[dict]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def remove(self, job_id: str) -> dict | None:
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def mark_finished(self, job: dict) -> None:
+        job["finished_at"] = time.time()
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep(time.time())
+
+    def _expired(self, job: dict, now: float) -> bool:
+        status = job.get("status")
+        if status in FINISHED_STATUSES:
+            return now - job.get("finished_at", job.get("created_at", now)) >= self.ttl
+        if status == "pending":
+            return now - job.get("created_at", now) >= self.pending_ttl
+        return False
+
+    def _drop(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id)
+        if job.get("status") == "pending":
+            self.reaped_pending += 1
+        self.evicted += 1
+
+    def _sweep(self, now: float) -> int:
+        expired = [jid for jid, job in self._jobs.items() if self._expired(job, now)]
+        for jid in expired:
+            self._drop(jid)
+        return len(expired)
+
+    def _evict_oldest(self, count: int) -> None:
+        candidates = [
+            (job.get("finished_at", job.get("created_at", 0)), jid)
+            for jid, job in self._jobs.items()
+            if job.get("status") in FINISHED_STATUSES or job.get("status") == "pending"
+        ]
+        candidates.sort()
+        for _, jid in candidates[:count]:
+            self._drop(jid)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status: dict[str, int] = {}
+            for job in self._jobs.values():
+                st = job.get("status", "unknown")
+                by_status[st] = by_status.get(st, 0) + 1
+            return {
+                "live": len(self._jobs),
+                "by_status": by_status,
+                "evicted": self.evicted,
+                "reaped_pending": self.reaped_pending,
+                "max_entries": self.max_entries,
+            }
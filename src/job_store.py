@@ -0,0 +1,696 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from job_registry import FINISHED_STATUSES, JobRegistry
+from progress_stream import PROGRESS_STATUS, ProgressChannel
+
+try:
+    import redis
+except Exception:
+    redis = None  # only needed for JOB_STORE=redis://...
+
+LEASE_LOST_MESSAGE = "Error: o processo que executava este job parou."
+
+
+class MemoryJobStore:
+    """Jobs and their event channels held in this process (the default).
+
+    Every backend has the same interface: `create`, `get`, `update`, `claim`,
+    `publish`, `finish`, `channel`, `subscribers`, `sweep` and `stats`.
+    `get`/`claim` return plain dicts; state is changed only through the store,
+    so the web code runs unchanged on a store shared by several processes.
+    """
+
+    backend = "memory"
+
+    def __init__(self, registry: JobRegistry, channel_factory=ProgressChannel):
+        self.registry = registry
+        self.channel_factory = channel_factory
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, job: dict) -> None:
+        self.registry.add(job_id, {**job, "events": self.channel_factory()})
+
+    def get(self, job_id: str) -> dict | None:
+        return self.registry.get(job_id)
+
+    def update(self, job_id: str, **fields) -> None:
+        job = self.registry.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+    def claim(self, job_id: str) -> dict | None:
+        """Move a pending job to "queued"; only the first caller gets the job
+        (with its `ydl_opts`, which are dropped from the stored job)."""
+        job = self.registry.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.get("status") != "pending":
+                return None
+            job["status"] = "queued"
+            opts = job.pop("ydl_opts", None)
+        return {**job, "ydl_opts": opts}
+
+    def publish(self, job_id: str, ev: dict) -> None:
+        ch = self.channel(job_id)
+        if ch is not None:
+            ch.put(ev)
+
+    def finish(self, job_id: str, ev: dict, **fields) -> None:
+        """Record the final state, publish the last event and close the stream."""
+        job = self.registry.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        self.registry.mark_finished(job)
+        job["events"].put(ev)
+        job["events"].put(None)
+
+    def channel(self, job_id: str) -> ProgressChannel | None:
+        job = self.registry.get(job_id)
+        return job.get("events") if job else None
+
+    def subscribers(self) -> int:
+        return sum(job["events"].subscribers for job in self.registry.values() if "events" in job)
+
+    def sweep(self) -> int:
+        return self.registry.sweep()
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, **self.registry.stats()}
+
+
+class _SharedJobStore:
+    """Base for stores shared between processes.
+
+    Jobs are records in the backend, events an append-only log per job with
+    increasing ids. State events are all kept; "downloading" updates are
+    written at most `max_rate` per second (the latest always wins) and only
+    the last `buffer_size` are kept.
+
+    Each process follows the logs its SSE clients are watching with a single
+    background thread and mirrors them into local ProgressChannels, so the
+    backend is polled once per job and interval however many clients there are.
+
+    A claimed job holds a lease of `lease_ttl` seconds that the claiming
+    process renews from a background thread while it runs the job. If that
+    process dies, the lease lapses and the first process to notice (a
+    follower of the job, or `sweep`) fails the job, so its streams end with
+    an error instead of showing it running forever.
+    """
+
+    backend = ""
+
+    def __init__(self, ttl: float = 600.0, pending_ttl: float = 300.0, max_rate: float = 4.0,
+                 buffer_size: int = 64, poll_interval: float = 0.25, lease_ttl: float = 60.0):
+        self.ttl = float(ttl)
+        self.pending_ttl = float(pending_ttl)
+        self.max_rate = max_rate
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.buffer_size = max(1, int(buffer_size))
+        self.poll_interval = max(0.01, float(poll_interval))
+        self._lock = threading.Lock()
+        self._mirrors: dict[str, ProgressChannel] = {}
+        self._idle_since: dict[str, float] = {}
+        self._wakeup = threading.Event()
+        self._follower: threading.Thread | None = None
+        # publisher side: held back progress update and time of the last write, per job
+        self._held: dict[str, dict] = {}
+        self._last_write: dict[str, float] = {}
+        # jobs this process claimed and has not finished: their leases are renewed
+        self.lease_ttl = max(1.0, float(lease_ttl))
+        self._owned: set[str] = set()
+        self._renewer: threading.Thread | None = None
+        self._next_reap = 0.0
+        self.evicted = 0
+        self.reaped = 0
+
+    # backend primitives ------------------------------------------------------
+    def _create(self, job_id: str, job: dict) -> None:
+        raise NotImplementedError
+
+    def _load(self, job_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def _update(self, job_id: str, fields: dict, finished: bool = False) -> None:
+        raise NotImplementedError
+
+    def _claim(self, job_id: str) -> dict | None:
+        """Move a pending job to "queued" and give it a lease; None if it is not pending."""
+        raise NotImplementedError
+
+    def _renew(self, job_ids: list[str]) -> None:
+        """Extend the leases of jobs this process runs."""
+        raise NotImplementedError
+
+    def _take_lapsed(self, job_ids: list[str] | None) -> list[str]:
+        """Of the given jobs (all when None), the queued/running ones whose lease
+        has lapsed and that this process takes over; each goes to one process only."""
+        raise NotImplementedError
+
+    def _append(self, job_id: str, ev: dict | None) -> None:
+        """Append an event (`None`: mark the log closed)."""
+        raise NotImplementedError
+
+    def _fetch(self, cursors: dict[str, int]) -> dict[str, tuple[list[tuple[int, dict]], bool]]:
+        """Events after each cursor, in id order, and whether the log is closed.
+        A job that no longer exists counts as closed."""
+        raise NotImplementedError
+
+    # store interface -----------------------------------------------------------
+    def create(self, job_id: str, job: dict) -> None:
+        self._create(job_id, {**job, "created_at": job.get("created_at", time.time())})
+
+    def get(self, job_id: str) -> dict | None:
+        return self._load(job_id)
+
+    def update(self, job_id: str, **fields) -> None:
+        self._update(job_id, fields)
+
+    def claim(self, job_id: str) -> dict | None:
+        job = self._claim(job_id)
+        if job is not None:
+            with self._lock:
+                self._owned.add(job_id)
+                if self._renewer is None:
+                    self._renewer = threading.Thread(target=self._renew_leases, name="job-store-lease", daemon=True)
+                    self._renewer.start()
+        return job
+
+    def _renew_leases(self) -> None:
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                owned = list(self._owned)
+            if owned:
+                try:
+                    self._renew(owned)
+                except Exception:
+                    pass  # backend briefly unavailable: the next beat retries, well within the lease
+
+    def _reap(self, job_ids: list[str] | None = None) -> int:
+        """Fail claimed jobs whose process stopped renewing their lease."""
+        lapsed = self._take_lapsed(job_ids)
+        for job_id in lapsed:
+            self.finish(job_id, {"status": "error", "message": LEASE_LOST_MESSAGE},
+                        status="error", message=LEASE_LOST_MESSAGE)
+        self.reaped += len(lapsed)
+        return len(lapsed)
+
+    def publish(self, job_id: str, ev: dict) -> None:
+        if ev.get("status") == PROGRESS_STATUS:
+            with self._lock:
+                if time.monotonic() - self._last_write.get(job_id, 0.0) < self.min_interval:
+                    self._held[job_id] = ev
+                    return
+                self._held.pop(job_id, None)
+                self._last_write[job_id] = time.monotonic()
+        else:
+            self._flush(job_id)
+        self._append(job_id, ev)
+
+    def _flush(self, job_id: str) -> None:
+        with self._lock:
+            held = self._held.pop(job_id, None)
+        if held is not None:
+            self._append(job_id, held)
+
+    def finish(self, job_id: str, ev: dict, **fields) -> None:
+        self._update(job_id, {**fields, "finished_at": time.time()}, finished=True)
+        self._flush(job_id)
+        self._append(job_id, ev)
+        self._append(job_id, None)
+        with self._lock:
+            self._last_write.pop(job_id, None)
+            self._owned.discard(job_id)
+
+    def channel(self, job_id: str) -> ProgressChannel | None:
+        with self._lock:
+            ch = self._mirrors.get(job_id)
+            if ch is not None:
+                self._idle_since.pop(job_id, None)
+                return ch
+        if self._load(job_id) is None:
+            return None
+        ch = ProgressChannel(max_rate=self.max_rate, buffer_size=self.buffer_size)
+        # Fill the mirror right away so the first client doesn't wait for the follower
+        batch, closed = self._fetch({job_id: 0}).get(job_id, ([], True))
+        self._apply(ch, batch, closed)
+        if closed:
+            return ch
+        with self._lock:
+            existing = self._mirrors.setdefault(job_id, ch)
+            if self._follower is None:
+                self._follower = threading.Thread(target=self._follow, name="job-store-follower", daemon=True)
+                self._follower.start()
+        self._wakeup.set()
+        return existing
+
+    @staticmethod
+    def _apply(ch: ProgressChannel, batch: list[tuple[int, dict]], closed: bool) -> None:
+        for seq, ev in batch:
+            if seq > ch.seq:
+                ch.put(ev, seq)
+        if closed:
+            ch.put(None)
+
+    def _follow(self) -> None:
+        while True:
+            with self._lock:
+                mirrors = dict(self._mirrors)
+            if not mirrors:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            if time.monotonic() >= self._next_reap:
+                # a watched job whose process died gets its error event before this fetch
+                self._next_reap = time.monotonic() + self.lease_ttl / 3
+                try:
+                    self._reap(list(mirrors))
+                except Exception:
+                    pass
+            try:
+                results = self._fetch({jid: ch.seq for jid, ch in mirrors.items()})
+            except Exception:
+                results = {}  # backend briefly unavailable: keep the streams open and retry
+            now = time.monotonic()
+            with self._lock:
+                for jid, ch in mirrors.items():
+                    batch, closed = results.get(jid, ([], False))
+                    self._apply(ch, batch, closed)
+                    # stop following finished jobs and jobs nobody has watched for a while
+                    if ch.subscribers:
+                        self._idle_since.pop(jid, None)
+                    else:
+                        self._idle_since.setdefault(jid, now)
+                    if closed or now - self._idle_since.get(jid, now) > 10.0:
+                        self._mirrors.pop(jid, None)
+                        self._idle_since.pop(jid, None)
+            time.sleep(self.poll_interval)
+
+    def subscribers(self) -> int:
+        """SSE clients attached to this process."""
+        with self._lock:
+            return sum(ch.subscribers for ch in self._mirrors.values())
+
+    def _expired(self, status: str, created_at: float, finished_at: float | None, now: float) -> bool:
+        if status in FINISHED_STATUSES:
+            return now - (finished_at or created_at) >= self.ttl
+        if status == "pending":
+            return now - created_at >= self.pending_ttl
+        return False  # queued/running: failed by `_reap` when their lease lapses, then expire as finished
+
+
+class SqliteJobStore(_SharedJobStore):
+    """Jobs and events in a sqlite file: several server processes on one host
+    (e.g. gunicorn/uvicorn workers) share it. WAL mode lets readers poll while
+    a worker writes."""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: str, max_entries: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self.max_entries = max(1, int(max_entries))
+        self._local = threading.local()
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL, "
+            "finished_at REAL, closed INTEGER NOT NULL DEFAULT 0, seq INTEGER NOT NULL DEFAULT 0, lease_until REAL)"
+        )
+        if "lease_until" not in {row[1] for row in db.execute("PRAGMA table_info(jobs)")}:
+            try:
+                db.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")  # file from an older version
+            except sqlite3.OperationalError:
+                pass  # added by another process meanwhile
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, progress INTEGER NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite connections are per thread; autocommit, with explicit write transactions
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+        return db
+
+    def _create(self, job_id: str, job: dict) -> None:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._sweep(db, time.time())
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, job.get("status", "pending"), json.dumps(job), job["created_at"]),
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _load(self, job_id: str) -> dict | None:
+        row = self._db().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, job_id: str, change, lease_until: float | None = None) -> dict | None:
+        # read-modify-write of the job record in one write transaction
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            result = None
+            if row is not None:
+                job = json.loads(row[0])
+                result = change(job)
+                if result is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, data = ?, finished_at = ?, lease_until = COALESCE(?, lease_until) "
+                        "WHERE id = ?",
+                        (job.get("status", ""), json.dumps(job), job.get("finished_at"), lease_until, job_id),
+                    )
+            db.execute("COMMIT")
+            return result
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _update(self, job_id: str, fields: dict, finished: bool = False) -> None:
+        def change(job: dict) -> dict:
+            job.update(fields)
+            return job
+        self._modify(job_id, change)
+
+    def _claim(self, job_id: str) -> dict | None:
+        def change(job: dict) -> dict | None:
+            if job.get("status") != "pending":
+                return None
+            claimed = {**job, "status": "queued"}
+            job.pop("ydl_opts", None)
+            job["status"] = "queued"
+            return claimed
+        return self._modify(job_id, change, lease_until=time.time() + self.lease_ttl)
+
+    def _renew(self, job_ids: list[str]) -> None:
+        until = time.time() + self.lease_ttl
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("UPDATE jobs SET lease_until = ? WHERE id = ? AND closed = 0",
+                           [(until, job_id) for job_id in job_ids])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _take_lapsed(self, job_ids: list[str] | None) -> list[str]:
+        query = ("SELECT id FROM jobs WHERE status IN ('queued', 'running') AND closed = 0 "
+                 "AND lease_until IS NOT NULL AND lease_until < ?")
+        params: list = [time.time()]
+        if job_ids is not None:
+            if not job_ids:
+                return []
+            query += " AND id IN (%s)" % ",".join("?" * len(job_ids))
+            params += job_ids
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            lapsed = [row[0] for row in db.execute(query, params).fetchall()]
+            # clearing the lease in this write transaction hands each job to one process
+            db.executemany("UPDATE jobs SET lease_until = NULL WHERE id = ?", [(jid,) for jid in lapsed])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return lapsed
+
+    def _append(self, job_id: str, ev: dict | None) -> None:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if ev is None:
+                db.execute("UPDATE jobs SET closed = 1 WHERE id = ?", (job_id,))
+            else:
+                db.execute("UPDATE jobs SET seq = seq + 1 WHERE id = ?", (job_id,))
+                row = db.execute("SELECT seq FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None:
+                    progress = int(ev.get("status") == PROGRESS_STATUS)
+                    db.execute(
+                        "INSERT INTO job_events (job_id, seq, progress, data) VALUES (?, ?, ?, ?)",
+                        (job_id, row[0], progress, json.dumps(ev)),
+                    )
+                    if progress:
+                        db.execute(
+                            "DELETE FROM job_events WHERE job_id = ? AND progress = 1 AND seq NOT IN ("
+                            "SELECT seq FROM job_events WHERE job_id = ? AND progress = 1 ORDER BY seq DESC LIMIT ?)",
+                            (job_id, job_id, self.buffer_size),
+                        )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _fetch(self, cursors: dict[str, int]) -> dict[str, tuple[list[tuple[int, dict]], bool]]:
+        db = self._db()
+        out = {}
+        db.execute("BEGIN")  # one snapshot per job: events and the closed flag agree
+        try:
+            for job_id, cursor in cursors.items():
+                row = db.execute("SELECT closed FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                rows = db.execute(
+                    "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, cursor),
+                ).fetchall()
+                out[job_id] = ([(seq, json.loads(data)) for seq, data in rows], row is None or bool(row[0]))
+        finally:
+            db.execute("COMMIT")
+        return out
+
+    def _sweep(self, db: sqlite3.Connection, now: float) -> int:
+        # caller holds a write transaction
+        rows = db.execute("SELECT id, status, created_at, finished_at FROM jobs").fetchall()
+        expired = [r[0] for r in rows if self._expired(r[1], r[2], r[3], now)]
+        live = len(rows) - len(expired)
+        if live >= self.max_entries:
+            # oldest finished or never-started jobs go first, as in JobRegistry
+            candidates = sorted(
+                (r[3] or r[2], r[0]) for r in rows
+                if r[0] not in expired and (r[1] in FINISHED_STATUSES or r[1] == "pending")
+            )
+            expired += [jid for _, jid in candidates[:live - self.max_entries + 1]]
+        for jid in expired:
+            db.execute("DELETE FROM jobs WHERE id = ?", (jid,))
+            db.execute("DELETE FROM job_events WHERE job_id = ?", (jid,))
+        self.evicted += len(expired)
+        return len(expired)
+
+    def sweep(self) -> int:
+        self._reap()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            n = self._sweep(db, time.time())
+            db.execute("COMMIT")
+            return n
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        by_status = {status: n for status, n in rows}
+        return {
+            "backend": self.backend,
+            "live": sum(by_status.values()),
+            "by_status": by_status,
+            "evicted": self.evicted,
+            "reaped": self.reaped,
+            "max_entries": self.max_entries,
+        }
+
+
+class RedisJobStore(_SharedJobStore):
+    """Jobs and events in Redis (or any server speaking its protocol), for
+    processes on different hosts.
+
+    A job is a hash of JSON-encoded fields; its state events and its recent
+    progress updates are two sorted sets scored by event id. Keys of pending
+    jobs expire after `pending_ttl`, keys of finished jobs after `ttl`. The
+    lease of a claimed job is a key of its own that expires after `lease_ttl`;
+    renewing it also pushes the expiry of the job's keys to `lease_ttl + ttl`,
+    so a job nobody fails after its process died still goes away.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "voxhub:", **kwargs):
+        if redis is None:
+            raise RuntimeError("JOB_STORE=redis requer o pacote 'redis' (pip install redis).")
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.r = redis.Redis.from_url(url)
+
+    def _keys(self, job_id: str) -> tuple[str, str, str]:
+        base = f"{self.prefix}job:{job_id}"
+        return base, base + ":state", base + ":progress"
+
+    def _hold(self, p, job_id: str) -> None:
+        # queue a lease renewal on pipeline `p`
+        for k in self._keys(job_id):
+            p.expire(k, max(1, int(self.lease_ttl + self.ttl)))
+        p.set(self._keys(job_id)[0] + ":lease", "1", ex=max(1, int(self.lease_ttl)))
+
+    def _create(self, job_id: str, job: dict) -> None:
+        key, _, _ = self._keys(job_id)
+        p = self.r.pipeline()
+        p.delete(key)
+        p.hset(key, mapping={k: json.dumps(v) for k, v in job.items()})
+        p.expire(key, max(1, int(self.pending_ttl)))
+        p.sadd(self.prefix + "jobs", job_id)
+        p.execute()
+
+    def _load(self, job_id: str) -> dict | None:
+        raw = self.r.hgetall(self._keys(job_id)[0])
+        if not raw:
+            return None
+        return {k.decode(): json.loads(v) for k, v in raw.items() if not k.startswith(b"_")}
+
+    def _update(self, job_id: str, fields: dict, finished: bool = False) -> None:
+        keys = self._keys(job_id)
+        if not self.r.exists(keys[0]):
+            return
+        p = self.r.pipeline()
+        p.hset(keys[0], mapping={k: json.dumps(v) for k, v in fields.items()})
+        if finished:
+            for k in keys:
+                p.expire(k, max(1, int(self.ttl)))
+        p.execute()
+
+    def _claim(self, job_id: str) -> dict | None:
+        key = self._keys(job_id)[0]
+        # HSETNX is atomic: exactly one process wins, even across hosts
+        if not self.r.exists(key) or not self.r.hsetnx(key, "_claimed", "1"):
+            return None
+        job = self._load(job_id)
+        if job is None or job.get("status") != "pending":
+            return None
+        p = self.r.pipeline()
+        p.hset(key, "status", json.dumps("queued"))
+        p.hdel(key, "ydl_opts")
+        self._hold(p, job_id)
+        p.execute()
+        return {**job, "status": "queued"}
+
+    def _renew(self, job_ids: list[str]) -> None:
+        p = self.r.pipeline()
+        for job_id in job_ids:
+            self._hold(p, job_id)
+        p.execute()
+
+    def _take_lapsed(self, job_ids: list[str] | None) -> list[str]:
+        if job_ids is None:
+            job_ids = [i.decode() for i in self.r.smembers(self.prefix + "jobs")]
+        p = self.r.pipeline()
+        for job_id in job_ids:
+            key = self._keys(job_id)[0]
+            p.hmget(key, "status", "_claimed", "_closed")
+            p.exists(key + ":lease")
+        replies = p.execute()
+        lapsed = []
+        for n, job_id in enumerate(job_ids):
+            (status, claimed, closed), leased = replies[2 * n], replies[2 * n + 1]
+            if status is None or claimed is None or closed is not None or leased:
+                continue
+            # HSETNX again decides which process takes the job over
+            if json.loads(status) in ("queued", "running") and self.r.hsetnx(self._keys(job_id)[0], "_reaped", "1"):
+                lapsed.append(job_id)
+        return lapsed
+
+    def _append(self, job_id: str, ev: dict | None) -> None:
+        key, state_key, progress_key = self._keys(job_id)
+        if ev is None:
+            self.r.hset(key, "_closed", "1")
+            return
+        seq = self.r.hincrby(key, "_seq", 1)
+        member = json.dumps([seq, ev])
+        p = self.r.pipeline()
+        if ev.get("status") == PROGRESS_STATUS:
+            p.zadd(progress_key, {member: seq})
+            p.zremrangebyrank(progress_key, 0, -self.buffer_size - 1)
+            p.expire(progress_key, max(1, int(self.lease_ttl + self.ttl)))
+        else:
+            p.zadd(state_key, {member: seq})
+            p.expire(state_key, max(1, int(self.lease_ttl + self.ttl)))
+        p.execute()
+
+    def _fetch(self, cursors: dict[str, int]) -> dict[str, tuple[list[tuple[int, dict]], bool]]:
+        p = self.r.pipeline(transaction=True)
+        order = list(cursors.items())
+        for job_id, cursor in order:
+            key, state_key, progress_key = self._keys(job_id)
+            p.hmget(key, "_closed", "status")
+            p.zrangebyscore(state_key, f"({cursor}", "+inf")
+            p.zrangebyscore(progress_key, f"({cursor}", "+inf")
+        replies = p.execute()
+        out = {}
+        for n, (job_id, _) in enumerate(order):
+            (closed, status), states, progress = replies[3 * n:3 * n + 3]
+            items = sorted((tuple(json.loads(m)) for m in states + progress), key=lambda i: i[0])
+            out[job_id] = (items, status is None or closed is not None)
+        return out
+
+    def sweep(self) -> int:
+        self._reap()
+        # expiry is done by Redis; just forget ids whose hash is gone
+        ids = [i.decode() for i in self.r.smembers(self.prefix + "jobs")]
+        p = self.r.pipeline()
+        for jid in ids:
+            p.exists(self._keys(jid)[0])
+        gone = [jid for jid, alive in zip(ids, p.execute()) if not alive]
+        if gone:
+            self.r.srem(self.prefix + "jobs", *gone)
+            self.evicted += len(gone)
+        return len(gone)
+
+    def stats(self) -> dict:
+        self.sweep()
+        ids = [i.decode() for i in self.r.smembers(self.prefix + "jobs")]
+        p = self.r.pipeline()
+        for jid in ids:
+            p.hget(self._keys(jid)[0], "status")
+        by_status: dict[str, int] = {}
+        for raw in p.execute():
+            if raw is not None:
+                st = json.loads(raw)
+                by_status[st] = by_status.get(st, 0) + 1
+        return {"backend": self.backend, "live": sum(by_status.values()), "by_status": by_status,
+                "evicted": self.evicted, "reaped": self.reaped}
+
+
+def make_job_store(spec: str, *, max_entries: int = 1000, ttl: float = 600.0, pending_ttl: float = 300.0,
+                   max_rate: float = 4.0, buffer_size: int = 64, poll_interval: float = 0.25, lease_ttl: float = 60.0):
+    """Build the store named by JOB_STORE: `memory` (default), `sqlite:///path/to/jobs.sqlite3`
+    or `redis://host:6379/0` (also `rediss://`)."""
+    spec = (spec or "memory").strip()
+    shared = dict(ttl=ttl, pending_ttl=pending_ttl, max_rate=max_rate, buffer_size=buffer_size,
+                  poll_interval=poll_interval, lease_ttl=lease_ttl)
+    if spec == "memory":
+        registry = JobRegistry(max_entries=max_entries, ttl=ttl, pending_ttl=pending_ttl)
+        return MemoryJobStore(registry, lambda: ProgressChannel(max_rate=max_rate, buffer_size=buffer_size))
+    if spec.startswith("sqlite:///"):
+        return SqliteJobStore(spec[len("sqlite:///"):], max_entries=max_entries, **shared)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisJobStore(spec, **shared)
+    raise ValueError(f"JOB_STORE inválido: {spec!r} (use memory, sqlite:///caminho ou redis://host:porta/db)")
@@ -0,0 +1,148 @@
+import bisect
+import math
+import threading
+from typing import Callable
+
+# Seconds; covers a cached extract (ms) up to a long download/encode (minutes)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # an unlabelled counter reads 0 before its first increment
+        self._values: dict[tuple, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # key -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = []
+        for key, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), row):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(round(row[-1], 6))}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from `fn`, which returns a number or
+    {label values tuple: number} for a labelled gauge."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float | dict], labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def _samples(self) -> list[str]:
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [f"{self.name} {_num(value)}"]
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(value.items())]
+
+
+class Registry:
+    """Metrics of this process in the Prometheus text format (version 0.0.4).
+
+    Counters and histograms are updated in place under a per-metric lock;
+    gauges call their function when scraped, so they should only read
+    in-memory state. A scrape costs one pass over the label sets.
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float | dict], labels: tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, fn, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                continue  # a failing gauge must not break the whole scrape
+        return "\n".join(lines) + "\n"
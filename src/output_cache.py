@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+
+def output_cache_key(info: dict, opts: dict) -> str | None:
+    """Content address for a converted output: same video, same format
+    selector and same FFmpeg postprocessor settings give the same file."""
+    extractor = info.get("extractor_key") or info.get("extractor")
+    video_id = info.get("id")
+    if not extractor or not video_id:
+        return None
+    parts = [
+        extractor,
+        video_id,
+        opts.get("format"),
+        opts.get("postprocessors") or [],
+    ]
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """LRU cache of finished audio files on disk, bounded by total bytes.
+
+    Each entry is `<key>.bin` plus a `<key>.json` sidecar holding the original
+    file name. The LRU order is rebuilt from file mtimes on start-up, so the
+    cache survives restarts.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        return os.path.join(self.root, key + ".bin"), os.path.join(self.root, key + ".json")
+
+    def _load(self) -> None:
+        found = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            data_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    meta = json.load(fh)
+                st = os.stat(data_path)
+            except (OSError, ValueError):
+                continue
+            found.append((st.st_mtime, key, {"filename": meta.get("filename"), "size": st.st_size}))
+        for _, key, entry in sorted(found):
+            self._entries[key] = entry
+            self._total += entry["size"]
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._total -= entry["size"]
+            self.evictions += 1
+            for p in self._paths(key):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def fetch(self, key: str | None, outdir: str) -> str | None:
+        """Copy a cached output into `outdir` and return its path, or None on miss."""
+        if not self.enabled or not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        data_path, _ = self._paths(key)
+        dest = os.path.join(outdir, entry["filename"])
+        try:
+            shutil.copyfile(data_path, dest)
+            os.utime(data_path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += entry["size"]
+        return dest
+
+    def store(self, key: str | None, filepath: str) -> None:
+        if not self.enabled or not key or not filepath or not os.path.isfile(filepath):
+            return
+        size = os.path.getsize(filepath)
+        if size > self.max_bytes:
+            return
+        data_path, meta_path = self._paths(key)
+        tmp = data_path + ".tmp"
+        try:
+            shutil.copyfile(filepath, tmp)
+            os.replace(tmp, data_path)
+            with open(meta_path, "w", encoding="utf-8") as fh:
+                json.dump({"filename": os.path.basename(filepath)}, fh)
+        except OSError:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total -= old["size"]
+            self._entries[key] = {"filename": os.path.basename(filepath), "size": size}
+            self._total += size
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
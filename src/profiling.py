@@ -0,0 +1,76 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+_KEY = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+
+
+class JobProfiler:
+    """cProfile captures of single jobs or requests, kept as `<key>.prof`
+    files in `directory` (the newest `keep` of them).
+
+    cProfile follows the thread it is started on, so a capture covers what
+    the job does on its worker thread: extraction, download, and the model
+    call of a transcription. FFmpeg conversions run in other processes and
+    are not in it; their time is in the job's postprocess span.
+    """
+
+    def __init__(self, directory: str, keep: int = 20):
+        self.directory = os.path.abspath(directory)
+        self.keep = max(1, int(keep))
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str | None:
+        """The capture of `key`, if there is one."""
+        if not _KEY.match(key or ""):
+            return None
+        path = os.path.join(self.directory, key + ".prof")
+        return path if os.path.isfile(path) else None
+
+    @contextmanager
+    def profile(self, key: str, enabled: bool = True) -> Iterator[None]:
+        if not enabled or not _KEY.match(key or ""):
+            yield
+            return
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            self._save(key, prof)
+
+    def _save(self, key: str, prof: cProfile.Profile) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = os.path.join(self.directory, f".{key}.tmp")
+            prof.dump_stats(tmp)
+            os.replace(tmp, os.path.join(self.directory, key + ".prof"))
+            self._prune()
+        except OSError:
+            pass  # profiling must never fail the job
+
+    def _prune(self) -> None:
+        with self._lock:
+            files = [e for e in os.scandir(self.directory) if e.name.endswith(".prof")]
+            files.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+            for old in files[self.keep:]:
+                try:
+                    os.remove(old.path)
+                except OSError:
+                    pass
+
+    def report(self, key: str, sort: str = "cumulative", limit: int = 40) -> str | None:
+        """pstats text of the capture of `key` (top `limit` functions by `sort`)."""
+        path = self.path(key)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterator
+
+PROGRESS_STATUS = "downloading"
+
+
+class ProgressChannel:
+    """Per-job event broadcaster for SSE streams.
+
+    Events get increasing ids and are kept in a small ring buffer. Any number
+    of subscribers can attach: each replays the buffer (or, after a reconnect,
+    what it has not seen yet) and then follows live events with its own
+    cursor, so readers never take events from each other.
+
+    High-frequency "downloading" updates are coalesced per subscriber: at most
+    `max_rate` per second are emitted and the one emitted is always the latest.
+    The last state event and last progress event are remembered apart from the
+    ring, so a subscriber that fell behind the buffer still resumes from the
+    current state. Subscribers can be threads (`events`) or coroutines
+    (`aevents`).
+    """
+
+    def __init__(self, max_rate: float = 4.0, buffer_size: int = 64):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self._cond = threading.Condition()
+        self._ring: deque[tuple[int, dict]] = deque(maxlen=max(1, int(buffer_size)))
+        self.seq = 0
+        self.closed = False
+        self.subscribers = 0
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+        self._last_state: tuple[int, dict] | None = None
+        self._last_progress: tuple[int, dict] | None = None
+
+    def put(self, ev: dict | None, seq: int | None = None) -> None:
+        """Publish an event; `None` closes the channel (same contract as the old job queue).
+
+        `seq` keeps the id the event already has in a shared job store, so
+        Last-Event-ID stays valid when a client reconnects to another process.
+        """
+        with self._cond:
+            if ev is None:
+                self.closed = True
+            else:
+                self.seq = self.seq + 1 if seq is None else seq
+                item = (self.seq, ev)
+                self._ring.append(item)
+                if ev.get("status") == PROGRESS_STATUS:
+                    self._last_progress = item
+                else:
+                    self._last_state = item
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, set()
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    def snapshot(self) -> list[tuple[int, dict]]:
+        """Latest state event and latest progress event, in id order."""
+        with self._cond:
+            return self._snapshot()
+
+    def _snapshot(self) -> list[tuple[int, dict]]:
+        items = [i for i in (self._last_state, self._last_progress) if i is not None]
+        return sorted(items, key=lambda i: i[0])
+
+    def _since(self, cursor: int) -> list[tuple[int, dict]]:
+        # caller holds the lock
+        items = [i for i in self._ring if i[0] > cursor]
+        oldest = self._ring[0][0] if self._ring else self.seq + 1
+        if cursor + 1 < oldest:
+            # events between the cursor and the buffer were dropped; bridge with the current state
+            items = [i for i in self._snapshot() if cursor < i[0] < oldest] + items
+        return items
+
+    def _read(self, sub: "_Subscriber") -> tuple[list[tuple[int, dict]], bool]:
+        # caller holds the lock; returns (new items, channel finished for this reader)
+        batch = self._since(sub.cursor)
+        return batch, self.closed and (not batch or batch[-1][0] >= self.seq)
+
+    def events(self, last_event_id: int | None = None, heartbeat: float = 10.0) -> Iterator[tuple[int, dict] | None]:
+        """Yield (id, event) pairs until the channel closes; `None` means "send a heartbeat".
+
+        Without `last_event_id` the ring buffer is replayed from the start; with
+        it (a reconnect) only what the client has not seen yet.
+        """
+        sub = _Subscriber(last_event_id or 0, self.min_interval)
+        with self._cond:
+            self.subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    batch, finished = self._read(sub)
+                    if not batch and not finished:
+                        self._cond.wait(sub.timeout(heartbeat))
+                        batch, finished = self._read(sub)
+                out = sub.feed(batch, finished)
+                yield from out
+                if finished:
+                    return
+                if not out and sub.pending is None:
+                    yield None
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    async def aevents(self, last_event_id: int | None = None, heartbeat: float = 10.0) -> AsyncIterator[tuple[int, dict] | None]:
+        """Async version of `events` for the ASGI server: waiting costs a
+        future on the event loop instead of a blocked thread."""
+        loop = asyncio.get_running_loop()
+        sub = _Subscriber(last_event_id or 0, self.min_interval)
+        with self._cond:
+            self.subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    batch, finished = self._read(sub)
+                    fut = None
+                    if not batch and not finished:
+                        fut = loop.create_future()
+                        self._waiters.add((loop, fut))
+                if fut is not None:
+                    try:
+                        await asyncio.wait_for(fut, sub.timeout(heartbeat))
+                    except asyncio.TimeoutError:
+                        pass
+                    finally:
+                        with self._cond:
+                            self._waiters.discard((loop, fut))
+                    with self._cond:
+                        batch, finished = self._read(sub)
+                out = sub.feed(batch, finished)
+                for item in out:
+                    yield item
+                if finished:
+                    return
+                if not out and sub.pending is None:
+                    yield None
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class _Subscriber:
+    """Cursor and coalescing state of one stream reading a ProgressChannel."""
+
+    def __init__(self, cursor: int, min_interval: float):
+        self.cursor = cursor
+        self.min_interval = min_interval
+        self.pending: tuple[int, dict] | None = None
+        self.last_emit = 0.0
+
+    def timeout(self, heartbeat: float) -> float:
+        if self.pending is not None:
+            return max(0.0, self.last_emit + self.min_interval - time.monotonic())
+        return heartbeat
+
+    @staticmethod
+    def _coalesce(batch: list[tuple[int, dict]]) -> list[tuple[int, dict]]:
+        out = []
+        for n, item in enumerate(batch):
+            nxt = batch[n + 1] if n + 1 < len(batch) else None
+            if item[1].get("status") == PROGRESS_STATUS and nxt and nxt[1].get("status") == PROGRESS_STATUS:
+                continue  # superseded by a newer progress update
+            out.append(item)
+        return out
+
+    def feed(self, batch: list[tuple[int, dict]], finished: bool) -> list[tuple[int, dict]]:
+        """Events to send now; the latest progress update may be held back for rate limiting."""
+        out = []
+        if batch:
+            self.cursor = batch[-1][0]
+        for item in self._coalesce(batch):
+            if item[1].get("status") == PROGRESS_STATUS:
+                self.pending = item
+                continue
+            if self.pending is not None:
+                out.append(self.pending)
+                self.pending = None
+            out.append(item)
+        if self.pending is not None and (finished or time.monotonic() - self.last_emit >= self.min_interval):
+            self.last_emit = time.monotonic()
+            out.append(self.pending)
+            self.pending = None
+        return out
@@ -0,0 +1,354 @@
+import ipaddress
+import threading
+import time
+import uuid
+from typing import Callable
+from urllib.parse import urlsplit
+
+from yt_dlp import YoutubeDL
+from yt_dlp.networking.exceptions import HTTPError
+
+try:
+    import redis
+except Exception:
+    redis = None  # only needed for UPSTREAM_LIMIT_STORE=redis://...
+
+# Second-level labels under which registrations happen one level deeper (bbc.co.uk, abc.net.au)
+_SECOND_LEVEL = ("co", "com", "net", "org", "gov", "ac", "edu")
+
+
+def host_key(url: str) -> str:
+    """Bucket an upstream URL belongs to: its registrable domain, so every
+    CDN node of a site (rr1---sn-abc.googlevideo.com, ...) shares one limit."""
+    host = (urlsplit(url).hostname or "").lower().rstrip(".")
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    labels = host.split(".")
+    keep = 3 if len(labels) >= 3 and labels[-2] in _SECOND_LEVEL and len(labels[-1]) == 2 else 2
+    return ".".join(labels[-keep:])
+
+
+def parse_limits(spec: str) -> dict[str, tuple[float, float, int]]:
+    """`host=rate:burst:concurrency,...` (UPSTREAM_LIMITS) -> {host: (rate, burst, concurrency)}."""
+    out = {}
+    for part in (spec or "").split(","):
+        host, _, values = part.strip().partition("=")
+        if not host or not values:
+            continue
+        rate, burst, concurrency = (values.split(":") + ["", "", ""])[:3]
+        out[host.strip().lower()] = (float(rate or 0), float(burst or 0), int(concurrency or 0))
+    return out
+
+
+class _HostState:
+    def __init__(self, rate: float, burst: float, concurrency: int):
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.concurrency = concurrency
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.blocked_until = 0.0
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+
+class HostLimiter:
+    """Token bucket and concurrency cap per upstream host, shared by every job
+    of the process.
+
+    `acquire(host)` blocks until the host's bucket has a token and fewer than
+    `concurrency` requests are open, and returns (seconds waited, release).
+    A 429 from the host (`penalize`) pauses it for the Retry-After time, so
+    the jobs back off together instead of each one hammering it again.
+    `rate=0` / `concurrency=0` turn either limit off; `limits` overrides
+    (rate, burst, concurrency) per host.
+    """
+
+    backend = "memory"
+
+    def __init__(self, rate: float = 10.0, burst: float = 20.0, concurrency: int = 8,
+                 limits: dict[str, tuple[float, float, int]] | None = None):
+        self.defaults = (float(rate), float(burst), int(concurrency))
+        self.limits = dict(limits or {})
+        self._hosts: dict[str, _HostState] = {}
+        self._cond = threading.Condition()
+
+    def _state(self, host: str) -> _HostState:
+        # caller holds the lock
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(*self.limits.get(host, self.defaults))
+        return state
+
+    def acquire(self, host: str) -> tuple[float, Callable[[], None]]:
+        t0 = time.monotonic()
+        with self._cond:
+            state = self._state(host)
+            while True:
+                now = time.monotonic()
+                state.refill(now)
+                if now < state.blocked_until:
+                    wait = state.blocked_until - now
+                elif state.concurrency and state.active >= state.concurrency:
+                    wait = None  # until a request of this host finishes
+                elif state.rate > 0 and state.tokens < 1:
+                    wait = (1 - state.tokens) / state.rate
+                else:
+                    break
+                state.waiting += 1
+                self._cond.wait(wait)
+                state.waiting -= 1
+            if state.rate > 0:
+                state.tokens -= 1
+            state.active += 1
+            waited = time.monotonic() - t0
+            state.requests += 1
+            state.waited += waited
+            state.max_wait = max(state.max_wait, waited)
+        return waited, _once(lambda: self._release(host))
+
+    def _release(self, host: str) -> None:
+        with self._cond:
+            self._hosts[host].active -= 1
+            self._cond.notify_all()
+
+    def penalize(self, host: str, seconds: float) -> None:
+        with self._cond:
+            state = self._state(host)
+            state.throttled += 1
+            state.blocked_until = max(state.blocked_until, time.monotonic() + seconds)
+            state.tokens = 0.0
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"backend": self.backend, "hosts": {
+                host: {
+                    "requests": s.requests,
+                    "active": s.active,
+                    "waiting": s.waiting,
+                    "wait_ms_total": round(s.waited * 1000, 1),
+                    "wait_ms_max": round(s.max_wait * 1000, 1),
+                    "throttled": s.throttled,
+                }
+                for host, s in self._hosts.items()
+            }}
+
+
+# Token bucket + lease set in one round trip; returns ms to wait (-1: wait for a lease), or 0 when granted.
+# Uses the server clock so processes on different hosts agree on time.
+_REDIS_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local rate, burst, cap, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[5])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked') or '0')
+if blocked > now then return tostring(blocked - now) end
+if cap > 0 then
+  redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+  if redis.call('ZCARD', KEYS[2]) >= cap then return '-1' end
+end
+if rate > 0 then
+  local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or burst)
+  local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+  tokens = math.min(burst, tokens + (now - ts) / 1000 * rate)
+  if tokens < 1 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    return tostring((1 - tokens) / rate * 1000)
+  end
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+end
+if cap > 0 then
+  redis.call('ZADD', KEYS[2], now + ttl, ARGV[4])
+  redis.call('PEXPIRE', KEYS[2], ttl)
+end
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return '0'
+"""
+
+_REDIS_PENALIZE = """
+local t = redis.call('TIME')
+local until_ms = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000 + tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked') or '0')
+if until_ms > blocked then redis.call('HSET', KEYS[1], 'blocked', tostring(until_ms), 'tokens', '0') end
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return 0
+"""
+
+
+class RedisHostLimiter(HostLimiter):
+    """`HostLimiter` whose buckets and open-request counts live in Redis, so
+    every server process (on any host) draws from the same per-host budget.
+
+    Open requests are leases in a sorted set that expire after `lease_ttl`
+    seconds, so a crashed process cannot hold a host's slots forever.
+    `stats()` reports this process's requests and waits.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "voxhub:", lease_ttl: float = 600.0, poll: float = 0.05, **kwargs):
+        if redis is None:
+            raise RuntimeError("UPSTREAM_LIMIT_STORE=redis requer o pacote 'redis' (pip install redis).")
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.poll = poll
+        self.r = redis.Redis.from_url(url)
+        self._acquire = self.r.register_script(_REDIS_ACQUIRE)
+        self._penalize = self.r.register_script(_REDIS_PENALIZE)
+
+    def _keys(self, host: str) -> list[str]:
+        base = f"{self.prefix}upstream:{host}"
+        return [base, base + ":leases"]
+
+    def acquire(self, host: str) -> tuple[float, Callable[[], None]]:
+        t0 = time.monotonic()
+        with self._cond:
+            state = self._state(host)
+            state.waiting += 1
+        rate, burst, concurrency = state.rate, state.burst, state.concurrency
+        lease = uuid.uuid4().hex
+        try:
+            while True:
+                wait_ms = float(self._acquire(self._keys(host), [rate, burst, concurrency, lease, int(self.lease_ttl * 1000)]))
+                if wait_ms == 0:
+                    break
+                time.sleep(self.poll if wait_ms < 0 else min(wait_ms / 1000, 1.0))
+        finally:
+            with self._cond:
+                state.waiting -= 1
+        waited = time.monotonic() - t0
+        with self._cond:
+            state.active += 1
+            state.requests += 1
+            state.waited += waited
+            state.max_wait = max(state.max_wait, waited)
+
+        def release() -> None:
+            self._release(host)
+            if concurrency:
+                self.r.zrem(self._keys(host)[1], lease)
+
+        return waited, _once(release)
+
+    def penalize(self, host: str, seconds: float) -> None:
+        with self._cond:
+            self._state(host).throttled += 1
+        self._penalize(self._keys(host)[:1], [int(seconds * 1000)])
+
+
+def make_limiter(spec: str, **kwargs) -> HostLimiter:
+    """UPSTREAM_LIMIT_STORE: `memory` (per process, default) or `redis://host:6379/0`."""
+    spec = (spec or "memory").strip()
+    if spec == "memory":
+        return HostLimiter(**kwargs)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisHostLimiter(spec, **kwargs)
+    raise ValueError(f"UPSTREAM_LIMIT_STORE inválido: {spec!r} (use memory ou redis://host:porta/db)")
+
+
+def _once(fn: Callable[[], None]) -> Callable[[], None]:
+    lock = threading.Lock()
+    done = False
+
+    def call() -> None:
+        nonlocal done
+        with lock:
+            if done:
+                return
+            done = True
+        fn()
+
+    return call
+
+
+def _retry_after(err: HTTPError, default: float) -> float:
+    try:
+        return max(1.0, float(err.response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return default
+
+
+class LimitedYoutubeDL(YoutubeDL):
+    """YoutubeDL whose every upstream request (extractor pages, manifests,
+    fragments and media) goes through a `HostLimiter` first.
+
+    The host slot is held until the response is read to the end, closed or
+    garbage collected. Waits of 50 ms or more are reported to the progress
+    hooks as `{"status": "throttled", "host", "wait"}`.
+    """
+
+    def __init__(self, params: dict | None = None, limiter: HostLimiter | None = None,
+                 penalty: float = 10.0, **kwargs):
+        self._hooks: list[Callable] = []
+        super().__init__(params, **kwargs)
+        self.limiter = limiter
+        self.penalty = penalty
+
+    def add_progress_hook(self, ph) -> None:
+        # kept here too, so urlopen does not read YoutubeDL's private list
+        super().add_progress_hook(ph)
+        self._hooks.append(ph)
+
+    def urlopen(self, req):
+        if self.limiter is None:
+            return super().urlopen(req)
+        host = host_key(req if isinstance(req, str) else req.url)
+        waited, release = self.limiter.acquire(host)
+        if waited >= 0.05:
+            for hook in self._hooks:
+                hook({"status": "throttled", "host": host, "wait": waited})
+        try:
+            resp = super().urlopen(req)
+        except HTTPError as e:
+            release()
+            if e.status == 429:
+                self.limiter.penalize(host, _retry_after(e, self.penalty))
+            raise
+        except BaseException:
+            release()
+            raise
+        _release_with(resp, release)
+        return resp
+
+
+class _ReleasingReader:
+    """Wraps a response's raw stream and frees the host slot at EOF, on close,
+    or when the response is dropped unread (the extractor peeked at it)."""
+
+    def __init__(self, fp, release: Callable[[], None]):
+        self._fp = fp
+        self._release = release
+
+    def read(self, *args, **kwargs):
+        data = self._fp.read(*args, **kwargs)
+        if not data and (args[0] if args else kwargs.get("amt")) != 0:
+            self._release()
+        return data
+
+    def close(self) -> None:
+        try:
+            self._fp.close()
+        finally:
+            self._release()
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def __del__(self):
+        self._release()
+
+
+def _release_with(resp, release: Callable[[], None]) -> None:
+    resp.fp = _ReleasingReader(resp.fp, release)
@@ -0,0 +1,89 @@
+import contextvars
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator
+
+logger = logging.getLogger("voxhub.trace")
+
+# Correlation fields (trace_id, kind, ...) of the job or request being handled
+_trace: contextvars.ContextVar[dict | None] = contextvars.ContextVar("voxhub_trace", default=None)
+
+
+def configure(target: str) -> None:
+    """TRACE_LOG: empty/`0` leaves spans off, `1`/`stderr` writes them to
+    stderr, anything else is a file the JSON lines are appended to."""
+    target = (target or "").strip()
+    if target in ("", "0"):
+        return
+    handler = logging.StreamHandler(sys.stderr) if target in ("1", "stderr", "-") else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def current() -> dict | None:
+    return _trace.get()
+
+
+@contextmanager
+def trace(trace_id: str, **fields) -> Iterator[dict]:
+    """Tag every span started in this context (thread or task) with `trace_id`
+    and `fields`; yields the dict, so later spans can get more fields."""
+    ctx = {"trace_id": trace_id, **{k: v for k, v in fields.items() if v is not None}}
+    token = _trace.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _trace.reset(token)
+
+
+class Span:
+    __slots__ = ("name", "fields", "started", "seconds")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+
+@contextmanager
+def span(name: str, **fields) -> Iterator[Span]:
+    """Time the block and log it as one JSON line; an exception marks it
+    `"status": "error"` and is re-raised. `Span.seconds` is set on exit."""
+    s = Span(name, fields)
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        s.seconds = time.perf_counter() - s.started
+        emit(name, s.seconds, error=error, **s.fields)
+
+
+def emit(name: str, seconds: float, *, error: BaseException | None = None, trace: dict | None = None, **fields) -> None:
+    """Log a span measured by the caller (e.g. one that ends on another
+    thread); `trace` defaults to the current context's."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    line = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        **(trace if trace is not None else _trace.get() or {}),
+        "span": name,
+        "ms": round(seconds * 1000, 1),
+        "status": "ok" if error is None else "error",
+        **fields,
+    }
+    if error is not None:
+        line["error"] = f"{type(error).__name__}: {error}"
+    logger.info(json.dumps(line, default=str))
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def transcript_cache_key(audio_bytes: bytes, model: str, prompt: str) -> str:
+    h = hashlib.sha256(audio_bytes)
+    h.update(b"\0" + model.encode("utf-8") + b"\0" + prompt.encode("utf-8"))
+    return h.hexdigest()
+
+
+class TranscriptCache:
+    """Persistent sqlite cache of transcripts, LRU-evicted by total text size.
+
+    Keys come from `transcript_cache_key` (audio content hash + model + prompt),
+    so re-uploading the same recording returns the stored text immediately.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int):
+        self.db_path = db_path
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        if self.enabled:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> str | None:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT text FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        if self._db is None or not text:
+            return
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._db.execute("SELECT size FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total -= old[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcripts (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._total += size
+            while self._total > self.max_bytes:
+                row = self._db.execute("SELECT key, size FROM transcripts ORDER BY last_used LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._db.execute("DELETE FROM transcripts WHERE key = ?", (row[0],))
+                self._total -= row[1]
+                self.evictions += 1
+            self._db.commit()
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._db.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0] if self._db else 0
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,294 @@
+import importlib.util
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+try:
+    from google.genai import types
+except Exception:
+    types = None  # a fake client in tests can consume the plain dict contents instead
+
+FALLBACK_MODEL = "gemini-2.0-flash"
+# Speech recognition needs far less than music: mono, 16 kHz, low-bitrate Opus.
+# Used for normalized uploads and for the windows of long-audio mode.
+SPEECH_ARGS = ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]
+SPEECH_MIME = "audio/ogg"
+
+
+def mime_for_filename(name: str, default: str = "audio/webm") -> str:
+    name = (name or "").lower()
+    if name.endswith(".wav"):
+        return "audio/wav"
+    if name.endswith(".mp3") or name.endswith(".mpeg"):
+        return "audio/mpeg"
+    if name.endswith(".m4a") or name.endswith(".mp4"):
+        return "audio/mp4"
+    if name.endswith(".ogg") or name.endswith(".opus"):
+        return "audio/ogg"
+    if name.endswith(".webm"):
+        return "audio/webm"
+    return default
+
+
+def ffmpeg_binary(location: str | None = None) -> str:
+    """Turn an `ffmpeg_location` (binary or folder, as accepted by yt-dlp) into an executable path."""
+    if location and os.path.isdir(location):
+        return os.path.join(location, "ffmpeg.exe" if os.name == "nt" else "ffmpeg")
+    return location or "ffmpeg"
+
+
+class SharedClient:
+    """Lazily created, process-wide `genai.Client`, reused across requests.
+
+    The client is thread-safe and keeps its HTTP connections alive, so only the
+    first request pays for construction and the TLS handshake. A new client is
+    built only if the API key changes. `genai_module` is injectable for tests.
+    """
+
+    def __init__(self, genai_module, timeout: float = 120.0, max_connections: int = 10, keepalive: float = 60.0):
+        self.genai = genai_module
+        self.timeout = float(timeout)
+        self.max_connections = max(1, int(max_connections))
+        self.keepalive = float(keepalive)
+        self._lock = threading.Lock()
+        self._client = None
+        self._key: str | None = None
+        self.created = 0
+
+    def _http_options(self):
+        if types is None:
+            return None
+        try:
+            import httpx
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive,
+            )
+            client_args = {"limits": limits}
+        except Exception:
+            client_args = None
+        # `client.aio` (the ASGI mode) has its own httpx client and needs the limits too;
+        # with aiohttp installed the SDK uses an aiohttp session there, which takes no httpx options
+        async_client_args = dict(client_args) if client_args and importlib.util.find_spec("aiohttp") is None else None
+        return types.HttpOptions(timeout=int(self.timeout * 1000), client_args=client_args,
+                                 async_client_args=async_client_args)
+
+    def get(self, api_key: str) -> tuple[object, float]:
+        """Return (client, seconds spent building it — 0 when reused)."""
+        with self._lock:
+            if self._client is not None and self._key == api_key:
+                return self._client, 0.0
+            t0 = time.perf_counter()
+            options = self._http_options()
+            if options is not None:
+                self._client = self.genai.Client(api_key=api_key, http_options=options)
+            else:
+                self._client = self.genai.Client(api_key=api_key)
+            self._key = api_key
+            self.created += 1
+            return self._client, time.perf_counter() - t0
+
+
+def build_contents(audio_bytes: bytes, mime: str, prompt: str) -> list:
+    if types is None:
+        return [{"parts": [{"inline_data": {"data": audio_bytes, "mime_type": mime}}, {"text": prompt}]}]
+    parts = [
+        types.Part.from_bytes(data=audio_bytes, mime_type=mime),
+        types.Part.from_text(text=prompt),
+    ]
+    return [types.Content(parts=parts)]
+
+
+def response_text(response) -> str:
+    text = getattr(response, "text", None)
+    if not text:
+        try:
+            text = response.candidates[0].content.parts[0].text
+        except Exception:
+            text = ""
+    return text or ""
+
+
+def transcribe_bytes(client, model: str, audio_bytes: bytes, mime: str, prompt: str,
+                     on_fallback: Callable[[str, Exception], None] | None = None) -> str:
+    """One `generate_content` call, retried once on the fallback model.
+    `on_fallback(model, error)` is called before the retry."""
+    contents = build_contents(audio_bytes, mime, prompt)
+    try:
+        response = client.models.generate_content(model=model, contents=contents)
+    except Exception as e:
+        if on_fallback:
+            on_fallback(model, e)
+        response = client.models.generate_content(model=FALLBACK_MODEL, contents=contents)
+    return response_text(response)
+
+
+async def atranscribe_bytes(client, model: str, audio_bytes: bytes, mime: str, prompt: str,
+                            on_fallback: Callable[[str, Exception], None] | None = None) -> str:
+    """`transcribe_bytes` on the client's asyncio API (`client.aio`), for the ASGI server."""
+    contents = build_contents(audio_bytes, mime, prompt)
+    try:
+        response = await client.aio.models.generate_content(model=model, contents=contents)
+    except Exception as e:
+        if on_fallback:
+            on_fallback(model, e)
+        response = await client.aio.models.generate_content(model=FALLBACK_MODEL, contents=contents)
+    return response_text(response)
+
+
+def probe_duration(path: str, ffmpeg: str = "ffmpeg") -> float:
+    """Duration in seconds, read from `ffmpeg -i` (ffprobe is not always installed).
+
+    Files that do not record it (`Duration: N/A`, e.g. WebM from a browser's
+    MediaRecorder) are decoded once and the last `time=` of the progress is used."""
+    proc = subprocess.run([ffmpeg, "-hide_banner", "-i", path], capture_output=True, text=True)
+    found = re.findall(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", proc.stderr)
+    if not found:
+        proc = subprocess.run([ffmpeg, "-hide_banner", "-i", path, "-vn", "-f", "null", "-"],
+                              capture_output=True, text=True)
+        found = re.findall(r"time=\s*(\d+):(\d+):(\d+(?:\.\d+)?)", proc.stderr) if proc.returncode == 0 else []
+    if not found:
+        raise RuntimeError("Não foi possível ler a duração do áudio.")
+    h, mnt, sec = found[-1]
+    return int(h) * 3600 + int(mnt) * 60 + float(sec)
+
+
+def plan_windows(duration: float, window: float, overlap: float) -> list[tuple[float, float]]:
+    """(start, length) of fixed-length windows where each starts `overlap` seconds
+    before the previous one ends."""
+    window = max(1.0, float(window))
+    overlap = max(0.0, min(float(overlap), window / 2))
+    step = window - overlap
+    out = []
+    start = 0.0
+    while start < duration:
+        out.append((start, min(window, duration - start)))
+        if start + window >= duration:
+            break
+        start += step
+    return out
+
+
+def _run_ffmpeg(cmd: list[str]) -> bytes:
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip() or "ffmpeg failed")
+    return proc.stdout
+
+
+def extract_window(path: str, start: float, length: float, ffmpeg: str = "ffmpeg") -> bytes:
+    return _run_ffmpeg([
+        ffmpeg, "-v", "error", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path, *SPEECH_ARGS, "pipe:1",
+    ])
+
+
+def normalize_speech_file(path: str, ffmpeg: str = "ffmpeg") -> bytes:
+    """Re-encode a whole file to the compact speech format (`SPEECH_MIME`)."""
+    return _run_ffmpeg([ffmpeg, "-v", "error", "-i", path, *SPEECH_ARGS, "pipe:1"])
+
+
+def normalize_speech(audio_bytes: bytes, ffmpeg: str = "ffmpeg", suffix: str = "") -> bytes:
+    # ffmpeg needs a seekable input for some containers (e.g. m4a with the index at the end)
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(audio_bytes)
+        return normalize_speech_file(path, ffmpeg)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _norm(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _edge_match(tail: list[str], head: list[str], max_gap: int) -> tuple[int, int, int]:
+    """Longest run of words shared by `tail` and `head` that ends at most
+    `max_gap` words before the end of `tail` and starts at most `max_gap`
+    words into `head`. Returns (start in tail, start in head, length)."""
+    best = (0, 0, 0)
+    prev = [0] * (len(head) + 1)
+    for i in range(1, len(tail) + 1):
+        row = [0] * (len(head) + 1)
+        for j in range(1, len(head) + 1):
+            if tail[i - 1] == head[j - 1]:
+                row[j] = size = prev[j - 1] + 1
+                if size > best[2] and len(tail) - i <= max_gap and j - size <= max_gap:
+                    best = (i - size, j - size, size)
+        prev = row
+    return best
+
+
+def stitch_transcripts(texts: list[str], max_overlap_words: int = 60, min_match: int = 3,
+                       max_gap: int | None = None) -> str:
+    """Join window transcripts in order, dropping the words repeated in the overlap.
+
+    The overlap is found as the longest run of (normalized) words shared by the
+    end of the text so far and the start of the next window; the text is cut at
+    the start of that run and continues with the next window from there. Words
+    cut in half at window edges therefore fall outside the match and are dropped.
+
+    The run must reach to within `max_gap` words (default: a quarter of
+    `max_overlap_words`) of the end of the text so far and start within
+    `max_gap` words of the next window; a phrase that merely recurs elsewhere
+    is not an overlap, and the windows are then joined as they are.
+    """
+    if max_gap is None:
+        max_gap = max(min_match, max_overlap_words // 4)
+    out: list[str] = []
+    for text in texts:
+        words = (text or "").split()
+        if not words:
+            continue
+        if not out:
+            out = words
+            continue
+        tail = [_norm(w) for w in out[-max_overlap_words:]]
+        head = [_norm(w) for w in words[:max_overlap_words]]
+        a, b, size = _edge_match(tail, head, max_gap)
+        if size >= min_match:
+            cut = len(out) - len(tail) + a
+            out = out[:cut] + words[b:]
+        else:
+            out.extend(words)
+    return " ".join(out)
+
+
+def transcribe_long_file(client, model: str, path: str, prompt: str, *, window: float = 300.0,
+                         overlap: float = 10.0, max_workers: int = 4, ffmpeg: str = "ffmpeg",
+                         on_fallback: Callable[[str, Exception], None] | None = None) -> tuple[str, int]:
+    """Split the audio file at `path` into overlapping windows, transcribe them
+    concurrently and stitch the results in order. Returns (text, number_of_windows)."""
+    windows = plan_windows(probe_duration(path, ffmpeg), window, overlap)
+
+    def work(span: tuple[float, float]) -> str:
+        chunk = extract_window(path, span[0], span[1], ffmpeg)
+        return transcribe_bytes(client, model, chunk, SPEECH_MIME, prompt, on_fallback)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+        texts = list(pool.map(work, windows))
+    # roughly three spoken words per second of overlap, with some slack
+    return stitch_transcripts(texts, max_overlap_words=max(20, int(overlap * 6))), len(windows)
+
+
+def transcribe_long(client, model: str, audio_bytes: bytes, prompt: str, *, suffix: str = "", **kwargs) -> tuple[str, int]:
+    """`transcribe_long_file` for in-memory audio (e.g. an upload)."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(audio_bytes)
+        return transcribe_long_file(client, model, path, prompt, **kwargs)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
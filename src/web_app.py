@@ -1,4 +1,4 @@
-from flask import Flask, request, render_template_string, jsonify, Response, redirect, send_from_directory
+from flask import Flask, request, render_template_string, jsonify, Response, redirect, send_file, send_from_directory
 import os
 import sys
 
@@ -9,13 +9,38 @@ from dotenv import load_dotenv
 load_dotenv()
 import uuid
 import json
-import queue
+import shutil
+import tempfile
+import functools
 import threading
 import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+from werkzeug.wsgi import ClosingIterator
 
 # Reuse helpers from the CLI module
-from download_audio import build_opts, resolve_ffmpeg_location, has_ffmpeg
+from download_audio import build_opts, resolve_ffmpeg_location, has_ffmpeg, split_postprocessors, convert_audio
+from job_pool import JobExecutor, ConversionPool
+from job_store import make_job_store
+from batch_progress import BatchProgress
+from audio_stream import STREAM_FORMATS, stream_command, stream_encoded, stream_source
+from ydl_pool import YoutubeDLPool
+from metrics import Registry
+from profiling import JobProfiler
+import tracing
+from download_tuner import DownloadTuner
+from rate_limit import LimitedYoutubeDL, host_key, make_limiter, parse_limits
+from output_cache import OutputCache, output_cache_key
+from info_cache import InfoCache
+from transcription import (
+    FALLBACK_MODEL, SPEECH_MIME, SharedClient, ffmpeg_binary, mime_for_filename, normalize_speech, normalize_speech_file,
+    transcribe_bytes, transcribe_long, transcribe_long_file,
+)
+from transcript_cache import TranscriptCache, transcript_cache_key
 
 # Gemini SDK (opcional, só usado na rota /transcribe)
 try:
@@ -25,8 +50,188 @@ except Exception:
     genai = None  # fallback: rota /transcribe retorna erro orientando instalar dependência
 
 app = Flask(__name__)
-# Simple in-memory job store for SSE progress
-jobs: dict[str, dict] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _cache_path(name: str) -> str:
+    return os.path.join("/tmp" if os.environ.get("VERCEL") == "1" else ".cache", name)
+
+
+# Job state and progress events; finished/abandoned jobs expire. JOB_STORE=sqlite:///... or
+# redis://... shares them between server processes, so /download, the job itself and
+# /progress can each be handled by a different worker; JOB_LEASE_TTL bounds how long the
+# jobs of a process that died keep showing as running.
+# SSE_MAX_RATE caps "downloading" updates per second sent to each client;
+# SSE_BUFFER recent events are replayed to every new subscriber
+jobs = make_job_store(
+    os.environ.get("JOB_STORE", "memory"),
+    max_entries=_env_int("JOB_MAX_ENTRIES", 1000),
+    ttl=_env_int("JOB_TTL", 600),
+    pending_ttl=_env_int("JOB_PENDING_TTL", 300),
+    max_rate=_env_int("SSE_MAX_RATE", 4),
+    buffer_size=_env_int("SSE_BUFFER", 64),
+    poll_interval=_env_int("JOB_STORE_POLL_MS", 250) / 1000,
+    lease_ttl=_env_int("JOB_LEASE_TTL", 60),
+)
+
+# Network stage: bounded pool that runs yt-dlp downloads; extra jobs wait in a capped queue
+executor = JobExecutor(
+    workers=_env_int("JOB_WORKERS", 2),
+    max_pending=_env_int("JOB_QUEUE_SIZE", 8),
+)
+# CPU stage: FFmpeg conversions run in worker processes (defaults to one per core)
+converter = ConversionPool(workers=_env_int("TRANSCODE_WORKERS", 0) or None)
+# Finishing a converted job (output cache copy, job store, next batch item) does I/O: it runs
+# here, not on the conversion pool's result thread, which would hold up every other result
+finisher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="convert-done")
+
+# Converted files keyed by video + format settings; OUTPUT_CACHE_MB=0 disables it
+output_cache = OutputCache(
+    root=os.environ.get("OUTPUT_CACHE_DIR") or _cache_path("voxhub-outputs"),
+    max_bytes=_env_int("OUTPUT_CACHE_MB", 1024) * 1024 * 1024,
+)
+
+# extract_info(download=False) results, so retries and format changes skip extraction
+info_cache = InfoCache(
+    ttl=_env_int("INFO_CACHE_TTL", 1800),
+    max_entries=_env_int("INFO_CACHE_SIZE", 256),
+    db_path=os.environ.get("INFO_CACHE_DB") or None,
+)
+
+# One Gemini client (and its keep-alive connection pool) shared by all requests
+genai_client = SharedClient(
+    genai,
+    timeout=_env_int("GENAI_TIMEOUT", 300),
+    max_connections=_env_int("GENAI_MAX_CONNECTIONS", 10),
+    keepalive=_env_int("GENAI_KEEPALIVE", 60),
+) if genai is not None else None
+
+# Largest /transcribe upload accepted; the whole file is held in memory
+TRANSCRIBE_MAX_UPLOAD = _env_int("TRANSCRIBE_MAX_UPLOAD_MB", 500) * 1024 * 1024
+
+# Transcripts keyed by audio hash + model + prompt; TRANSCRIPT_CACHE_MB=0 disables it
+transcript_cache = TranscriptCache(
+    db_path=os.environ.get("TRANSCRIPT_CACHE_DB") or _cache_path("voxhub-transcripts.sqlite3"),
+    max_bytes=_env_int("TRANSCRIPT_CACHE_MB", 64) * 1024 * 1024,
+)
+
+
+# Per-host request budget for everything yt-dlp fetches (pages, manifests, media), shared by
+# all jobs; UPSTREAM_LIMIT_STORE=redis://... shares it between processes. 0 disables a limit
+upstream = make_limiter(
+    os.environ.get("UPSTREAM_LIMIT_STORE", "memory"),
+    rate=_env_int("UPSTREAM_RATE", 10),
+    burst=_env_int("UPSTREAM_BURST", 20),
+    concurrency=_env_int("UPSTREAM_CONCURRENCY", 8),
+    limits=parse_limits(os.environ.get("UPSTREAM_LIMITS", "")),
+)
+
+# Warm YoutubeDL instances per option profile; YDL_POOL_SIZE=0 builds a fresh one per job
+ydl_pool = YoutubeDLPool(
+    max_idle=_env_int("YDL_POOL_SIZE", 2),
+    factory=functools.partial(LimitedYoutubeDL, limiter=upstream),
+)
+
+
+# Batches being run by this process: batch id -> tracker, item job id -> batch id.
+# BATCH_PARALLEL items of one batch run at a time (default: JOB_WORKERS)
+batches: dict[str, BatchProgress] = {}
+_batch_of: dict[str, str] = {}
+_batch_jobs: dict[str, dict] = {}
+BATCH_PARALLEL = _env_int("BATCH_PARALLEL", 0) or _env_int("JOB_WORKERS", 2)
+BATCH_MAX_ITEMS = _env_int("BATCH_MAX_ITEMS", 100)
+BATCH_FORMATS = ("mp3", "m4a", "mp4")  # what build_opts accepts (mp4 means m4a)
+
+
+# Fragment concurrency and HTTP chunk size per upstream host, tuned from the throughput of
+# earlier downloads; DOWNLOAD_TUNING=0 keeps yt-dlp's defaults
+tuner = DownloadTuner(max_concurrency=_env_int("TUNE_MAX_FRAGMENTS", 8)) if _env_int("DOWNLOAD_TUNING", 1) else None
+
+
+# Live /stream conversions: each holds a thread and an FFmpeg process while it runs
+stream_slots = threading.BoundedSemaphore(max(1, _env_int("STREAM_WORKERS", 4)))
+
+
+def _stage_stats() -> dict:
+    return {"download": executor.stats(), "transcode": converter.stats()}
+
+
+# /metrics: counters of this process plus gauges read from in-memory state at scrape time
+# (nothing that touches the shared job store), so frequent scrapes stay cheap
+metrics = Registry()
+jobs_finished = metrics.counter("voxhub_jobs_finished_total", "Download/transcription jobs finished, by final status", ("status",))
+batches_finished = metrics.counter("voxhub_batches_finished_total", "Batches and playlists finished")
+stage_seconds = metrics.histogram("voxhub_stage_seconds", "Duration of job stages (postprocess includes its wait for a CPU worker)", ("stage", "status"))
+downloaded_bytes = metrics.counter("voxhub_downloaded_bytes_total", "Bytes downloaded from upstream by jobs")
+transcribe_seconds = metrics.histogram("voxhub_transcribe_seconds", "Model time of transcriptions, by requested model", ("model",))
+transcribe_fallbacks = metrics.counter("voxhub_transcribe_fallbacks_total", "Model calls retried on the fallback model, by requested model", ("model",))
+transcribe_cached = metrics.counter("voxhub_transcribe_cache_hits_total", "Transcriptions answered from the transcript cache", ("model",))
+metrics.gauge("voxhub_queue_depth", "Jobs waiting for a worker", lambda: {(k,): v["pending"] for k, v in _stage_stats().items()}, ("stage",))
+metrics.gauge("voxhub_workers_active", "Busy workers", lambda: {(k,): v["active"] for k, v in _stage_stats().items()}, ("stage",))
+metrics.gauge("voxhub_workers", "Worker pool size", lambda: {(k,): v["workers"] for k, v in _stage_stats().items()}, ("stage",))
+metrics.gauge("voxhub_sse_subscribers", "Progress streams open on this process", lambda: jobs.subscribers())
+metrics.gauge("voxhub_batches_running", "Batches being run by this process", lambda: len(batches))
+
+
+def _job_outcome(ev: dict) -> str:
+    if ev.get("status") == "error":
+        return "error"
+    return "skipped" if ev.get("skipped") else "cached" if ev.get("cached") else "done"
+
+
+def _count_fallback(model: str, error: Exception) -> None:
+    transcribe_fallbacks.inc(model=model)
+    ctx = tracing.current()
+    if ctx is not None:
+        ctx["fallback"] = True  # shows on the model span that ends next
+
+
+def _fallback_hook(ctx: dict):
+    """on_fallback for one transcription: counts the retry and marks `ctx`, so
+    the fallback model's text is not cached as the requested model's."""
+    def hook(model: str, error: Exception) -> None:
+        ctx["fallback"] = True
+        _count_fallback(model, error)
+    return hook
+
+
+# Timing spans per job/request phase as JSON lines (TRACE_LOG=1 for stderr, or a file path),
+# correlated by job id or X-Request-ID. PROFILE_JOBS=1, or an `X-Profile: 1` header on the
+# request that creates a job, captures a cProfile of it for GET /profile/<id>
+tracing.configure(os.environ.get("TRACE_LOG", ""))
+profiler = JobProfiler(os.environ.get("PROFILE_DIR") or _cache_path("voxhub-profiles"), keep=_env_int("PROFILE_KEEP", 20))
+PROFILE_JOBS = _env_int("PROFILE_JOBS", 0) == 1
+
+
+def _profile_requested() -> bool:
+    return PROFILE_JOBS or (request.headers.get("X-Profile") or "").strip().lower() in ("1", "true", "on")
+
+
+def _request_id(headers) -> str:
+    """Correlation id of a request: the client's X-Request-ID if usable, else a new one."""
+    rid = (headers.get("X-Request-ID") or "").strip()
+    return rid if re.fullmatch(r"[0-9A-Za-z_-]{1,64}", rid) else uuid.uuid4().hex
+
+
+@contextmanager
+def _stage(name: str, **fields):
+    """A traced job phase whose duration also feeds voxhub_stage_seconds,
+    with status "error" when it raises."""
+    status = "error"
+    t0 = time.perf_counter()  # timed here too, in case the span fails on entry
+    try:
+        with tracing.span(name, **fields) as s:
+            yield s
+        status = "ok"
+    finally:
+        stage_seconds.observe(time.perf_counter() - t0, stage=name, status=status)
+
 
 INDEX_HTML = """
 <!doctype html>
@@ -309,6 +514,10 @@ INDEX_HTML = """
                 <input type="text" id="bitrate" name="bitrate" value="320" />
               </div>
             </div>
+            <label for="playlist" style="margin-top:1rem;display:flex;align-items:center;gap:8px;">
+              <input type="checkbox" id="playlist" name="playlist" value="1" style="width:auto;" />
+              Baixar playlist ou canal inteiro
+            </label>
             <label for="ffmpeg" style="margin-top:2rem;margin-bottom:10px;">Caminho FFmpeg (opcional)</label>
             <input type="text" id="ffmpeg" name="ffmpeg" placeholder="tools/ffmpeg/bin ou C:\\ffmpeg\\bin" />
             <div class="examples">Dica: Rode <code>scripts\\install_ffmpeg.ps1</code>, depois use <code>tools\\ffmpeg\\bin</code>. Deixe vazio para auto-detectar.</div>
@@ -319,6 +528,7 @@ INDEX_HTML = """
           <div class="examples" id="status" style="display:none;">Preparando…</div>
           <div class="row-actions" id="downloads-actions" style="margin-top:8px;">
             <button id="open-downloads" class="button-secondary" style="display:none;">Abrir downloads</button>
+            <a id="file-link" class="button-secondary" style="display:none;" download>Baixar arquivo</a>
           </div>
         </div>
       </div>
@@ -412,6 +622,7 @@ INDEX_HTML = """
       const statusEl = document.getElementById('status');
       const themeToggle = document.getElementById('theme-toggle');
       const openDownloadsBtn = document.getElementById('open-downloads');
+      const fileLink = document.getElementById('file-link');
       const scrollTopBtn = document.getElementById('scroll-top');
        // Recorder elements
        const recStartBtn = document.getElementById('rec-start');
@@ -926,13 +1137,31 @@ INDEX_HTML = """
             progress.style.display = 'block';
             statusEl.style.display = 'block';
             statusEl.textContent = 'Iniciando…';
+            if (fileLink) { fileLink.style.display = 'none'; }
             statusEl.classList.remove('status-ok', 'status-error');
             statusEl.classList.add('status-progress');
             const es = new EventSource(`/progress/${data.job_id}`);
             let lastTotalSize = 0;
             es.onmessage = (ev) => {
               let payload = {}; try { payload = JSON.parse(ev.data); } catch {}
-              if (payload.status === 'downloading') {
+              if (payload.status === 'queued') {
+                const pos = payload.position ? ` (posição ${payload.position})` : '';
+                statusEl.textContent = `Na fila${pos}…`;
+                statusEl.classList.remove('status-ok', 'status-error');
+                statusEl.classList.add('status-progress');
+              } else if (payload.status === 'running') {
+                statusEl.textContent = 'Iniciando download…';
+              } else if (payload.status === 'throttled') {
+                statusEl.textContent = `Limite de requisições de ${payload.host}: aguardou ${(payload.wait_ms/1000).toFixed(1)}s`;
+              } else if (payload.status === 'item') {
+                // playlist: one entry changed state
+                progressBar.style.width = Math.max(0, Math.min(100, payload.pct || 0)) + '%';
+                statusEl.textContent = `Playlist: ${payload.processed} de ${payload.total} concluídos` + (payload.failed ? ` • ${payload.failed} com erro` : '');
+              } else if (payload.status === 'downloading' && payload.items) {
+                progressBar.style.width = Math.max(0, Math.min(100, payload.pct || 0)) + '%';
+                const speed = payload.speed ? (payload.speed/1024/1024).toFixed(2) + ' MB/s' : '--';
+                statusEl.textContent = `Playlist: ${payload.processed} de ${payload.total} • Velocidade ${speed}`;
+              } else if (payload.status === 'downloading') {
                 const pct = Math.max(0, Math.min(100, payload.pct || 0));
                 if (payload.total) lastTotalSize = payload.total;
                 progressBar.style.width = pct + '%';
@@ -942,7 +1171,7 @@ INDEX_HTML = """
                 statusEl.classList.remove('status-ok', 'status-error');
                 statusEl.classList.add('status-progress');
               } else if (payload.status === 'finished' || payload.stage === 'postprocessing') {
-                statusEl.textContent = 'Convertendo áudio…';
+                statusEl.textContent = payload.position ? `Aguardando conversão (posição ${payload.position})…` : 'Convertendo áudio…';
                 statusEl.classList.remove('status-ok', 'status-error');
                 statusEl.classList.add('status-progress');
               } else if (payload.status === 'complete') {
@@ -952,6 +1181,7 @@ INDEX_HTML = """
                 statusEl.classList.add('status-ok');
                 setMessage(payload.message || 'Concluído!', 'success');
                 if (openDownloadsBtn) { openDownloadsBtn.style.display = 'inline-block'; }
+                if (fileLink && payload.file_url) { fileLink.href = payload.file_url; fileLink.style.display = 'inline-block'; }
                 es.close();
                 addHistory({ url, format: formatSel.value, ts: Date.now(), status: 'ok', size: formatBytes(lastTotalSize) });
                 overlay.style.display = 'none';
@@ -971,7 +1201,16 @@ INDEX_HTML = """
               }
             };
             es.onerror = () => {
-              statusEl.textContent = 'Conexão de progresso perdida.';
+              if (es.readyState === EventSource.CLOSED) {
+                // the stream was refused (429: download queue full), so EventSource gives up
+                statusEl.textContent = 'Servidor ocupado: muitas conversões em andamento. Tente novamente em instantes.';
+                statusEl.classList.remove('status-ok', 'status-progress');
+                statusEl.classList.add('status-error');
+                if (currentHistoryBtn) { currentHistoryBtn.classList.remove('loading'); currentHistoryBtn.removeAttribute('disabled'); currentHistoryBtn = null; }
+                return;
+              }
+              // EventSource reconnects by itself and the server resumes from the current state
+              statusEl.textContent = 'Conexão de progresso perdida. Reconectando…';
             };
           } else {
             const text = (data && data.message) || 'Falha na conversão.';
@@ -1253,6 +1492,36 @@ INDEX_HTML = """
 """
 
 
+# Auto-detect a local FFmpeg under tools/**/bin if PATH doesn't have it
+def find_local_ffmpeg_bin() -> str | None:
+    project_root = os.path.dirname(os.path.dirname(__file__))
+    tools_dir = os.path.join(project_root, "tools")
+    if not os.path.isdir(tools_dir):
+        return None
+    # common path produced by our installer
+    direct_bin = os.path.join(tools_dir, "ffmpeg", "bin")
+    if os.path.isfile(os.path.join(direct_bin, "ffmpeg.exe")) or os.path.isfile(os.path.join(direct_bin, "ffmpeg")):
+        return direct_bin
+    # otherwise scan all subdirectories for a bin/ffmpeg(.exe)
+    try:
+        for entry in os.listdir(tools_dir):
+            p = os.path.join(tools_dir, entry)
+            if os.path.isdir(p):
+                bin_candidate = os.path.join(p, "bin")
+                if os.path.isfile(os.path.join(bin_candidate, "ffmpeg.exe")) or os.path.isfile(os.path.join(bin_candidate, "ffmpeg")):
+                    return bin_candidate
+    except Exception:
+        return None
+    return None
+
+
+def default_ffmpeg_location() -> str | None:
+    """FFmpeg for server-side work that has no user-supplied path (e.g. /transcribe)."""
+    if has_ffmpeg():
+        return None
+    return find_local_ffmpeg_bin()
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template_string(
@@ -1263,57 +1532,45 @@ def index():
     )
 
 
-@app.route("/download", methods=["POST"])
-def download():
-    url = (request.form.get("url") or "").strip()
-    audio_format = (request.form.get("format") or "mp3").strip()
-    bitrate_str = (request.form.get("bitrate") or "320").strip()
-    ffmpeg_path = (request.form.get("ffmpeg") or "").strip() or None
+BUSY_MESSAGE = "Servidor ocupado: muitas conversões em andamento. Tente novamente em instantes."
+
+
+def _busy_response():
+    resp = jsonify({"status": "busy", "message": BUSY_MESSAGE})
+    resp.headers["Retry-After"] = "10"
+    return resp, 429
 
+
+def _parse_bitrate(value) -> int:
     try:
-        bitrate = int(bitrate_str)
+        return int(str(value or "320").strip())
     except ValueError:
-        bitrate = 320
+        return 320
 
-    is_vercel = os.environ.get("VERCEL") == "1"
-    outdir = "/tmp/downloads" if is_vercel else "downloads"
+
+def _download_outdir() -> str:
+    outdir = "/tmp/downloads" if os.environ.get("VERCEL") == "1" else "downloads"
     os.makedirs(outdir, exist_ok=True)
+    return outdir
 
-    ffmpeg_loc = resolve_ffmpeg_location(ffmpeg_path) if ffmpeg_path else None
-    is_fetch = request.headers.get("X-Requested-With") == "fetch"
-
-    # Auto-detect a local FFmpeg under tools/**/bin if PATH doesn't have it
-    def find_local_ffmpeg_bin() -> str | None:
-        project_root = os.path.dirname(os.path.dirname(__file__))
-        tools_dir = os.path.join(project_root, "tools")
-        if not os.path.isdir(tools_dir):
-            return None
-        # common path produced by our installer
-        direct_bin = os.path.join(tools_dir, "ffmpeg", "bin")
-        if os.path.isfile(os.path.join(direct_bin, "ffmpeg.exe")) or os.path.isfile(os.path.join(direct_bin, "ffmpeg")):
-            return direct_bin
-        # otherwise scan all subdirectories for a bin/ffmpeg(.exe)
-        try:
-            for entry in os.listdir(tools_dir):
-                p = os.path.join(tools_dir, entry)
-                if os.path.isdir(p):
-                    bin_candidate = os.path.join(p, "bin")
-                    if os.path.isfile(os.path.join(bin_candidate, "ffmpeg.exe")) or os.path.isfile(os.path.join(bin_candidate, "ffmpeg")):
-                        return bin_candidate
-        except Exception:
-            return None
-        return None
 
+def _download_ffmpeg(ffmpeg_path: str | None) -> tuple[str | None, str | None]:
+    """(ffmpeg_location, error message) for a download request."""
+    ffmpeg_loc = resolve_ffmpeg_location(ffmpeg_path) if ffmpeg_path else None
     if not ffmpeg_loc and not has_ffmpeg():
         auto_bin = find_local_ffmpeg_bin()
         if auto_bin:
             ffmpeg_loc = auto_bin
-        elif not is_vercel:
+        elif os.environ.get("VERCEL") != "1":
             # On Vercel, we might not have ffmpeg, but we proceed to try (some formats might work)
             # or we fail later.
-            msg = "FFmpeg not found. Install it (winget/choco) or run scripts\\install_ffmpeg.ps1 and set tools\\ffmpeg\\bin above."
-            return (jsonify({"status": "error", "message": msg}) if is_fetch else render_template_string(INDEX_HTML, message=msg))
+            return None, "FFmpeg not found. Install it (winget/choco) or run scripts\\install_ffmpeg.ps1 and set tools\\ffmpeg\\bin above."
+    return ffmpeg_loc, None
+
 
+def _create_download_job(url: str, audio_format: str, bitrate: int, ffmpeg_loc: str | None,
+                         outdir: str, **fields) -> str:
+    """Store a pending download job and return its id; it runs once its progress stream is opened."""
     ydl_opts = build_opts(
         outdir=outdir,
         audio_format=audio_format,
@@ -1323,19 +1580,129 @@ def download():
         cookiefile=None,
         ffmpeg_location=ffmpeg_loc,
     )
+    # The runner installs its own SSE hooks; keep the stored options plain data
+    ydl_opts.pop("progress_hooks", None)
 
     # Job manager and SSE progress
     job_id = uuid.uuid4().hex
-    q = queue.Queue()
     # Store necessary info to run the job later (in /progress)
-    jobs[job_id] = {
-        "queue": q,
+    jobs.create(job_id, {
         "status": "pending",
         "outdir": outdir,
         "message": "",
         "url": url,
-        "ydl_opts": ydl_opts
-    }
+        "ydl_opts": ydl_opts,
+        **({"profile": True} if _profile_requested() else {}),
+        **fields,
+    })
+    return job_id
+
+
+def _playlist_entries(url: str, audio_format: str, bitrate: int, ffmpeg_loc: str | None,
+                      outdir: str) -> tuple[dict, list[dict]] | None:
+    """Entries of a playlist or channel URL via flat extraction, or None if it is a single video.
+
+    Flat extraction lists the entries without resolving each video, so it
+    costs one page request instead of one extraction per entry. Each entry
+    gets the path its converted file would have when it has a title to build
+    it from, so files already on disk are skipped without any request.
+    """
+    opts = build_opts(
+        outdir=outdir,
+        audio_format=audio_format,
+        bitrate=bitrate,
+        no_playlist=False,
+        outtmpl=None,
+        cookiefile=None,
+        ffmpeg_location=ffmpeg_loc,
+    )
+    opts.pop("progress_hooks", None)
+    opts.update(extract_flat="in_playlist", playlistend=BATCH_MAX_ITEMS)
+    with ydl_pool.checkout(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        if info.get("_type") != "playlist":
+            return None
+        entries = []
+        for entry in info.get("entries") or []:
+            entry_url = (entry or {}).get("url") or (entry or {}).get("webpage_url")
+            if not entry_url:
+                continue  # private/removed videos show up as empty entries
+            path = _expected_output(ydl, entry, opts) if entry.get("title") else None
+            entries.append({"url": entry_url, "title": entry.get("title"), "path": path})
+    return {"title": info.get("title"), "id": info.get("id")}, entries
+
+
+def _create_playlist_batch(url: str, audio_format: str, bitrate: int, ffmpeg_loc: str | None, outdir: str):
+    """Expand a playlist into a batch of download jobs (see `/batch`); None if `url` is a single video."""
+    expanded = _playlist_entries(url, audio_format, bitrate, ffmpeg_loc, outdir)
+    if expanded is None:
+        return None
+    playlist, entries = expanded
+    if not entries:
+        return jsonify({"status": "error", "message": "A playlist não tem vídeos disponíveis."})
+
+    batch_id = uuid.uuid4().hex
+    items = []
+    for i, entry in enumerate(entries):
+        job_id = _create_download_job(entry["url"], audio_format, bitrate, ffmpeg_loc, outdir,
+                                      batch=batch_id, index=i, skip_existing=True)
+        item = {"job_id": job_id, "url": entry["url"]}
+        if entry["path"] and os.path.isfile(entry["path"]):
+            # already converted by an earlier run: done without downloading, still served by /files
+            message = f"Já existe: {os.path.basename(entry['path'])}"
+            jobs.finish(job_id, {"status": "complete", "message": message, "skipped": True, "file_url": f"/files/{job_id}"},
+                        status="done", message=message, filepath=os.path.abspath(entry["path"]))
+            jobs_finished.inc(status="skipped")
+            item.update(status="skipped", message=message, file_url=f"/files/{job_id}")
+        items.append(item)
+    jobs.create(batch_id, {
+        "status": "pending",
+        "kind": "batch",
+        "outdir": outdir,
+        "message": "",
+        "title": playlist["title"],
+        "items": items,
+    })
+    skipped = sum(1 for it in items if it.get("status") == "skipped")
+    return jsonify({
+        "status": "ok",
+        # the UI follows job_id: the batch stream reports the playlist as N of M
+        "job_id": batch_id,
+        "batch_id": batch_id,
+        "job_ids": [it["job_id"] for it in items],
+        "playlist": {**playlist, "count": len(items), "skipped": skipped},
+        "outdir": os.path.abspath(outdir),
+    })
+
+
+@app.route("/download", methods=["POST"])
+def download():
+    url = (request.form.get("url") or "").strip()
+    audio_format = (request.form.get("format") or "mp3").strip()
+    bitrate = _parse_bitrate(request.form.get("bitrate"))
+    ffmpeg_path = (request.form.get("ffmpeg") or "").strip() or None
+    playlist = request.form.get("playlist") == "1"
+
+    outdir = _download_outdir()
+    is_fetch = request.headers.get("X-Requested-With") == "fetch"
+
+    ffmpeg_loc, msg = _download_ffmpeg(ffmpeg_path)
+    if msg:
+        return (jsonify({"status": "error", "message": msg}) if is_fetch else render_template_string(INDEX_HTML, message=msg))
+
+    if executor.is_full():
+        return _busy_response()
+
+    if playlist:
+        try:
+            resp = _create_playlist_batch(url, audio_format, bitrate, ffmpeg_loc, outdir)
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"Error: {e}"})
+        if resp is not None:
+            return resp
+        # not a playlist: a regular single download
+
+    job_id = _create_download_job(url, audio_format, bitrate, ffmpeg_loc, outdir)
 
     # On Vercel (or generally to avoid freezing), we start the thread when the client connects to SSE.
     # However, for local dev, starting immediately is fine. 
@@ -1344,148 +1711,803 @@ def download():
     return jsonify({"status": "ok", "job_id": job_id, "outdir": os.path.abspath(outdir)})
 
 
+@app.route("/batch", methods=["POST"])
+def batch():
+    """Many downloads in one request, followed on a single aggregated stream.
+
+    Accepts JSON `{"items": [url | {"url", "format", "bitrate"}], "format",
+    "bitrate", "ffmpeg"}` (or `"urls"`), or a form with one URL per line in
+    `urls`. A bare JSON array is taken as the items. Every item becomes a
+    regular download job; the batch itself runs when `/progress/<batch_id>`
+    is opened.
+    """
+    data = request.get_json(silent=True) or {}
+    if isinstance(data, list):
+        data = {"items": data}
+    elif not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Corpo JSON inválido: envie um objeto ou uma lista de URLs."}), 400
+    if data:
+        raw_items = data.get("items") or data.get("urls") or []
+    else:
+        data = request.form
+        raw_items = (data.get("urls") or "").splitlines()
+    # JSON fields can be any type: coerce them, and check every item before creating any job
+    default_format = str(data.get("format") or "mp3").strip()
+    default_bitrate = _parse_bitrate(data.get("bitrate"))
+
+    items = []
+    for i, raw in enumerate(raw_items if isinstance(raw_items, list) else []):
+        item = raw if isinstance(raw, dict) else {"url": raw}
+        url = str(item.get("url") or "").strip()
+        if not url:
+            continue
+        audio_format = str(item.get("format") or default_format).strip()
+        if audio_format not in BATCH_FORMATS:
+            return jsonify({"status": "error", "message": f"Item {i} ({url}): formato inválido {audio_format!r}. Use mp3 ou m4a."}), 400
+        items.append((url, audio_format, _parse_bitrate(item.get("bitrate") or default_bitrate)))
+    if not items:
+        return jsonify({"status": "error", "message": "Informe ao menos uma URL."}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"status": "error", "message": f"Máximo de {BATCH_MAX_ITEMS} URLs por lote."}), 400
+
+    ffmpeg_loc, msg = _download_ffmpeg(str(data.get("ffmpeg") or "").strip() or None)
+    if msg:
+        return jsonify({"status": "error", "message": msg})
+    if executor.is_full():
+        return _busy_response()
+
+    outdir = _download_outdir()
+    batch_id = uuid.uuid4().hex
+    job_ids = [
+        _create_download_job(url, audio_format, bitrate, ffmpeg_loc, outdir, batch=batch_id, index=i)
+        for i, (url, audio_format, bitrate) in enumerate(items)
+    ]
+    jobs.create(batch_id, {
+        "status": "pending",
+        "kind": "batch",
+        "outdir": outdir,
+        "message": "",
+        "items": [{"job_id": job_id, "url": url} for job_id, (url, _, _) in zip(job_ids, items)],
+    })
+    return jsonify({"status": "ok", "batch_id": batch_id, "job_ids": job_ids, "outdir": os.path.abspath(outdir)})
+
+
+@app.route("/stream")
+def stream_audio():
+    """Convert while downloading: FFmpeg reads the source stream and its output
+    goes to the client as it is encoded, with no output file on the server."""
+    url = (request.args.get("url") or "").strip()
+    audio_format = (request.args.get("format") or "mp3").strip()
+    audio_format = "m4a" if audio_format == "mp4" else audio_format
+    try:
+        bitrate = int((request.args.get("bitrate") or "320").strip())
+    except ValueError:
+        bitrate = 320
+    if not url:
+        return jsonify({"status": "error", "message": "Informe a URL do vídeo."}), 400
+    if audio_format not in STREAM_FORMATS:
+        return jsonify({"status": "error", "message": "Formato inválido. Use 'mp3' ou 'm4a'."}), 400
+    if not stream_slots.acquire(blocking=False):
+        return _busy_response()
+
+    try:
+        ffmpeg_loc = default_ffmpeg_location()
+        download_opts, _ = split_postprocessors(build_opts(
+            outdir=tempfile.gettempdir(),
+            audio_format=audio_format,
+            bitrate=bitrate,
+            no_playlist=True,
+            outtmpl=None,
+            cookiefile=None,
+            ffmpeg_location=ffmpeg_loc,
+        ))
+        download_opts.pop("progress_hooks", None)
+        with ydl_pool.checkout(download_opts) as ydl:
+            info, _ = _extract_info(ydl, url)
+        source = stream_source(info)
+        if source is None:
+            stream_slots.release()
+            msg = "Esta fonte não pode ser transmitida durante a conversão; use o download normal."
+            return jsonify({"status": "error", "message": msg}), 422
+        cmd = stream_command(source, audio_format, bitrate, ffmpeg_binary(ffmpeg_loc))
+        # FFmpeg fetches the media itself: take the host slot on its behalf for the whole stream
+        _, release_host = upstream.acquire(host_key(source["url"]))
+        try:
+            chunks = stream_encoded(cmd)
+        except Exception:
+            release_host()
+            raise
+    except Exception as e:
+        stream_slots.release()
+        return jsonify({"status": "error", "message": str(e)}), 502
+
+    filename = f"{info.get('title') or info.get('id') or 'audio'}.{audio_format}"
+    disposition = "attachment" if request.args.get("download") == "1" else "inline"
+    # close() runs when the response ends or the client disconnects: stop FFmpeg, free the slot
+    body = ClosingIterator(chunks, [release_host, stream_slots.release])
+    resp = Response(body, mimetype=STREAM_FORMATS[audio_format]["mime"], direct_passthrough=True)
+    resp.headers["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"  # don't let nginx buffer the live stream
+    return resp
+
+
+def _transcription_key() -> str | None:
+    # Ler chave do ambiente (preferir GEMINI_API_KEY, aceitar GOOGLE_API_KEY)
+    return os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+
+
+def _normalize_requested(form) -> bool:
+    # TRANSCRIBE_NORMALIZE sets the default; a `normalize` form field overrides it per request
+    value = (form.get("normalize") or os.environ.get("TRANSCRIBE_NORMALIZE") or "0").strip()
+    return value in ("1", "true", "on")
+
+
+def _upload_too_large() -> dict:
+    return {"status": "error", "message": f"Arquivo muito grande (máximo {TRANSCRIBE_MAX_UPLOAD // (1024 * 1024)} MB)."}
+
+
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get("Content-Length") or 0)
+    except ValueError:
+        return 0
+
+
+def _transcribe_unavailable() -> tuple[dict, int] | None:
+    # Validar dependência e chave
+    if genai is None:
+        return {"status": "error", "message": "Dependência 'google-genai' não instalada. Rode: pip install google-genai"}, 500
+    if not _transcription_key():
+        return {"status": "error", "message": "Defina a variável de ambiente GEMINI_API_KEY (ou GOOGLE_API_KEY) para usar a transcrição."}, 500
+    return None
+
+
+def _transcribe_params(form, headers) -> dict:
+    """Per-request options of /transcribe, from the form fields and headers."""
+    return {
+        "model_name": (form.get("model") or "gemini-2.5-flash").strip(),
+        "prompt": (form.get("prompt") or "Transcribe the audio to text with punctuation.").strip(),
+        "long_mode": (form.get("long") or "").strip() in ("1", "true", "on"),
+        "bypass": (form.get("nocache") or "").strip() in ("1", "true", "on")
+        or "no-cache" in (headers.get("Cache-Control") or ""),
+        "normalize": _normalize_requested(form),
+    }
+
+
+def _read_upload(f) -> tuple[bytes, str]:
+    # Em alguns ambientes, f.read pode já ter consumido o stream; garantir seek(0)
+    try:
+        audio_bytes = f.read()
+    except Exception:
+        f.stream.seek(0)
+        audio_bytes = f.stream.read()
+    mime = (getattr(f, "mimetype", None) or "").strip().lower()
+    if not mime:
+        mime = mime_for_filename(f.filename or "")
+    return audio_bytes, mime
+
+
+def _transcribe_prepare(audio_bytes: bytes, mime: str, model_name: str, prompt: str, *,
+                        path: str | None = None, suffix: str = "", long_mode: bool = False,
+                        bypass: bool = False, normalize: bool = False) -> dict:
+    """Everything before the model call: transcript cache lookup and optional
+    speech normalization. Returns the context for the call; its "result" already
+    holds the text on a cache hit."""
+    ctx = {
+        "cache_key": transcript_cache_key(audio_bytes, model_name, prompt),
+        "result": {"cached": False},
+        "audio_bytes": audio_bytes,
+        "payload": audio_bytes,
+        "mime": mime,
+        "model_name": model_name,
+        "prompt": prompt,
+        "path": path,
+        "suffix": suffix,
+        "ffmpeg": ffmpeg_binary(default_ffmpeg_location()),
+    }
+    # Same audio + model + prompt: answer from the transcript cache (unless bypassed)
+    if bypass:
+        transcript_cache.note_bypass()
+    else:
+        cached_text = transcript_cache.get(ctx["cache_key"])
+        if cached_text is not None:
+            ctx["result"] = {"text": cached_text, "cached": True}
+            transcribe_cached.inc(model=model_name)
+            return ctx
+
+    # Mono 16 kHz Opus is plenty for speech and far smaller than the upload
+    if normalize and not long_mode:
+        t_norm = time.perf_counter()
+        try:
+            if path:
+                ctx["payload"] = normalize_speech_file(path, ctx["ffmpeg"])
+            else:
+                ctx["payload"] = normalize_speech(audio_bytes, ctx["ffmpeg"], suffix)
+            ctx["mime"] = SPEECH_MIME
+        except Exception:
+            pass  # keep the original if FFmpeg can't handle it
+        ctx["result"]["preprocess"] = {
+            "original_bytes": len(audio_bytes),
+            "normalized_bytes": len(ctx["payload"]),
+            "normalized": ctx["payload"] is not audio_bytes,
+            "transcode_ms": round((time.perf_counter() - t_norm) * 1000, 1),
+        }
+    # Long recordings are split into overlapping windows and transcribed in parallel
+    ctx["long"] = long_mode or len(ctx["payload"]) > _env_int("TRANSCRIBE_LONG_BYTES", 20 * 1024 * 1024)
+    return ctx
+
+
+def _transcribe_long_ctx(client, ctx: dict) -> str:
+    long_opts = {
+        "window": _env_int("TRANSCRIBE_WINDOW_SECONDS", 300),
+        "overlap": _env_int("TRANSCRIBE_OVERLAP_SECONDS", 10),
+        "max_workers": _env_int("TRANSCRIBE_MAX_PARALLEL", 4),
+        "ffmpeg": ctx["ffmpeg"],
+        "on_fallback": _fallback_hook(ctx),
+    }
+    if ctx["path"]:
+        text, chunks = transcribe_long_file(client, ctx["model_name"], ctx["path"], ctx["prompt"], **long_opts)
+    else:
+        text, chunks = transcribe_long(
+            client, ctx["model_name"], ctx["audio_bytes"], ctx["prompt"], suffix=ctx["suffix"], **long_opts
+        )
+    ctx["result"]["chunks"] = chunks
+    return text
+
+
+def _transcribe_finish(ctx: dict, text: str, setup_s: float, t0: float) -> dict:
+    result = ctx["result"]
+    result["text"] = text or ""
+    model_s = time.perf_counter() - t0
+    result["timings"] = {"client_setup_ms": round(setup_s * 1000, 1), "model_ms": round(model_s * 1000, 1)}
+    transcribe_seconds.observe(model_s, model=ctx["model_name"])
+    if ctx.get("fallback"):
+        # (some of) the text came from FALLBACK_MODEL: not an answer of the requested model to cache
+        result["fallback_model"] = FALLBACK_MODEL
+    else:
+        transcript_cache.put(ctx["cache_key"], result["text"])
+    return result
+
+
+def _transcribe_audio(key: str, audio_bytes: bytes, mime: str, model_name: str, prompt: str, **kwargs) -> dict:
+    """Transcription shared by /transcribe and URL jobs: transcript cache, shared
+    client, optional speech normalization and long-audio mode for big inputs.
+    Returns the response fields."""
+    with tracing.span("prepare", bytes=len(audio_bytes)) as s:
+        ctx = _transcribe_prepare(audio_bytes, mime, model_name, prompt, **kwargs)
+        s.set(cached=ctx["result"]["cached"], payload_bytes=len(ctx["payload"]))
+    if ctx["result"]["cached"]:
+        return ctx["result"]
+    client, setup_s = genai_client.get(key)
+    t0 = time.perf_counter()
+    with tracing.span("model", model=model_name, long=ctx["long"]) as s:
+        if ctx["long"]:
+            text = _transcribe_long_ctx(client, ctx)
+            s.set(chunks=ctx["result"]["chunks"])
+        else:
+            text = transcribe_bytes(client, model_name, ctx["payload"], ctx["mime"], prompt, _fallback_hook(ctx))
+    return _transcribe_finish(ctx, text, setup_s, t0)
+
+
 @app.route("/transcribe", methods=["POST"])
 def transcribe():
-    # Validar dependência
-    if genai is None:
-        return jsonify({"status": "error", "message": "Dependência 'google-genai' não instalada. Rode: pip install google-genai"}), 500
-    # Ler chave do ambiente (preferir GEMINI_API_KEY, aceitar GOOGLE_API_KEY)
-    key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-    if not key:
-        return jsonify({"status": "error", "message": "Defina a variável de ambiente GEMINI_API_KEY (ou GOOGLE_API_KEY) para usar a transcrição."}), 500
+    unavailable = _transcribe_unavailable()
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1]
 
+    if _content_length(request.headers) > TRANSCRIBE_MAX_UPLOAD:
+        return jsonify(_upload_too_large()), 413
     f = request.files.get("audio")
     if not f:
         return jsonify({"status": "error", "message": "Envie um arquivo de áudio ou use a gravação."}), 400
 
-    model_name = (request.form.get("model") or "gemini-2.5-flash").strip()
-    prompt = (request.form.get("prompt") or "Transcribe the audio to text with punctuation.").strip()
-
     # Ler bytes diretamente e enviar inline ao modelo (evita upload/ragStore)
+    request_id = _request_id(request.headers)
+    profiled = _profile_requested()
     try:
-        # Em alguns ambientes, f.read pode já ter consumido o stream; garantir seek(0)
-        try:
-            audio_bytes = f.read()
-        except Exception:
-            f.stream.seek(0)
-            audio_bytes = f.stream.read()
-
-        mime = (getattr(f, "mimetype", None) or "").strip().lower()
-        if not mime:
-            name = (f.filename or "").lower()
-            if name.endswith(".wav"):
-                mime = "audio/wav"
-            elif name.endswith(".mp3") or name.endswith(".mpeg"):
-                mime = "audio/mpeg"
-            elif name.endswith(".m4a") or name.endswith(".mp4"):
-                mime = "audio/mp4"
-            elif name.endswith(".ogg"):
-                mime = "audio/ogg"
-            elif name.endswith(".webm"):
-                mime = "audio/webm"
-            else:
-                mime = "audio/webm"
+        with tracing.trace(request_id, kind="transcribe"), profiler.profile(request_id, profiled), \
+                tracing.span("transcribe"):
+            audio_bytes, mime = _read_upload(f)
+            params = _transcribe_params(request.form, request.headers)
+            result = _transcribe_audio(
+                _transcription_key(), audio_bytes, mime, params.pop("model_name"), params.pop("prompt"),
+                suffix=os.path.splitext(f.filename or "")[1], **params,
+            )
+        if profiled:
+            result["profile_url"] = f"/profile/{request_id}"
+        resp, code = jsonify({"status": "ok", "request_id": request_id, **result}), 200
+    except Exception as e:
+        resp, code = jsonify({"status": "error", "message": str(e), "request_id": request_id}), 500
+    resp.headers["X-Request-ID"] = request_id
+    return resp, code
 
-        client = genai.Client(api_key=key)
 
-        content_parts = [
-            types.Part.from_bytes(data=audio_bytes, mime_type=mime),
-            types.Part.from_text(text=prompt)
-        ]
+@app.route("/transcribe_url", methods=["POST"])
+def transcribe_url():
+    unavailable = _transcribe_unavailable()
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1]
+    url = (request.form.get("url") or "").strip()
+    if not url:
+        return jsonify({"status": "error", "message": "Informe a URL do vídeo."}), 400
+    if executor.is_full():
+        return _busy_response()
+
+    # Download only: the model takes the native audio stream, no FFmpeg encode needed
+    ydl_opts, _ = split_postprocessors(build_opts(
+        outdir=tempfile.gettempdir(),
+        audio_format="m4a",
+        bitrate=0,
+        no_playlist=True,
+        outtmpl=None,
+        cookiefile=None,
+        ffmpeg_location=default_ffmpeg_location(),
+    ))
+    ydl_opts["format"] = "bestaudio[ext=m4a]/bestaudio/best"
+    ydl_opts.pop("progress_hooks", None)
+
+    job_id = uuid.uuid4().hex
+    jobs.create(job_id, {
+        "status": "pending",
+        "kind": "transcribe",
+        "message": "",
+        "url": url,
+        "ydl_opts": ydl_opts,
+        "model": (request.form.get("model") or "gemini-2.5-flash").strip(),
+        "prompt": (request.form.get("prompt") or "Transcribe the audio to text with punctuation.").strip(),
+        "normalize": _normalize_requested(request.form),
+        **({"profile": True} if _profile_requested() else {}),
+    })
+    # Like /download, the job starts when the client opens /progress/<job_id>
+    return jsonify({"status": "ok", "job_id": job_id})
+
+
+def _sse(data: dict, event_id: int | None = None) -> str:
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _final_filepath(info: dict | None) -> str | None:
+    # After postprocessing yt-dlp records the converted file per requested download
+    for d in (info or {}).get("requested_downloads") or []:
+        if d.get("filepath"):
+            return d["filepath"]
+    return None
+
+
+def _extract_info(ydl: YoutubeDL, url: str) -> tuple[dict, bool]:
+    """Metadata for `url`, from the info cache when possible. Returns (info, from_cache)."""
+    info = info_cache.get(url)
+    if info is not None:
+        return info, True
+    info = ydl.sanitize_info(ydl.extract_info(url, download=False), remove_private_keys=True)
+    info_cache.put(url, info)
+    return info, False
+
+
+def _progress_hook(job_id: str, finished_stage: str = "postprocessing", timings: dict | None = None,
+                   tuning: dict | None = None):
+    # `timings` gets first_byte_ms: job start to the first downloaded byte
+    # (extractor/session setup included, which is what the YoutubeDL pool saves),
+    # and limiter_wait_ms: time spent queued on the upstream rate limiter.
+    # `tuning` (filled by _tune_download) gets the measured throughput for the tuner
+    started = time.perf_counter()
+
+    def hook(d):
+        status = d.get("status")
+        ev = {"status": status}
+        if status == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+            downloaded = d.get("downloaded_bytes", 0) or 0
+            ev["total"] = int(total)
+            ev["downloaded"] = int(downloaded)
+            ev["pct"] = (downloaded / total * 100) if total else 0.0
+            ev["eta"] = d.get("eta")
+            ev["speed"] = d.get("speed") or 0
+            if timings is not None and downloaded and "first_byte_ms" not in timings:
+                elapsed = time.perf_counter() - started
+                timings["first_byte_ms"] = round(elapsed * 1000, 1)
+                ydl_pool.note_first_byte(elapsed)
+        elif status == "finished":
+            ev["stage"] = finished_stage
+            ev["filename"] = d.get("filename")
+            downloaded = d.get("downloaded_bytes") or d.get("total_bytes") or 0
+            downloaded_bytes.inc(downloaded)
+            if tuning and d.get("elapsed"):
+                tuning["throughput_bps"] = round(downloaded / d["elapsed"]) if d["elapsed"] > 0 else 0
+                tuner.record(tuning, downloaded, d["elapsed"])
+        elif status == "throttled":
+            # waited for the per-host upstream limiter (see rate_limit.LimitedYoutubeDL)
+            ev["host"] = d.get("host")
+            ev["wait_ms"] = round(d.get("wait", 0) * 1000, 1)
+            if timings is not None:
+                timings["limiter_wait_ms"] = round(timings.get("limiter_wait_ms", 0) + ev["wait_ms"], 1)
+        _publish(job_id, ev)
+    return hook
+
+
+def _expected_output(ydl: YoutubeDL, info: dict, opts: dict) -> str | None:
+    """Path the converted file of `info` gets under the job's output template."""
+    codecs = [pp.get("preferredcodec") for pp in opts.get("postprocessors") or [] if pp.get("key") == "FFmpegExtractAudio"]
+    ext = codecs[0] if codecs else info.get("ext")
+    return ydl.prepare_filename({**info, "ext": ext}) if ext else None
+
+
+def _tune_download(ydl: YoutubeDL, info: dict, tuning: dict) -> None:
+    """Apply the tuner's fragment concurrency and chunk size for this job's host to `ydl`."""
+    if tuner is None:
+        return
+    tuning.update(tuner.choose(info))
+    # downloaders read these from ydl.params when they start, so per job is enough
+    ydl.params["concurrent_fragment_downloads"] = tuning["concurrent_fragment_downloads"]
+    ydl.params["http_chunk_size"] = tuning["http_chunk_size"]
+
+
+def _job_extra(timings: dict, tuning: dict) -> dict | None:
+    return {k: v for k, v in (("timings", timings), ("tuning", tuning)) if v} or None
+
+
+def _download_from_info(ydl: YoutubeDL, url: str, info: dict, from_cache: bool) -> dict:
+    try:
+        return ydl.process_ie_result(info, download=True)
+    except DownloadError:
+        if not from_cache:
+            raise
+        # Cached stream URLs may have expired early; refresh once and retry
+        info_cache.invalidate(url)
+        info, _ = _extract_info(ydl, url)
+        return ydl.process_ie_result(info, download=True)
+
+
+def run_job(job_id: str, url: str, opts: dict, job: dict):
+    download_opts, postprocessors = split_postprocessors(opts)
+    timings: dict = {}
+    tuning: dict = {}
+    download_opts["progress_hooks"] = [_progress_hook(job_id, timings=timings, tuning=tuning)]  # override hooks for SSE
+    try:
+        with ydl_pool.checkout(download_opts) as ydl:
+            with _stage("extract") as s:
+                info, from_cache = _extract_info(ydl, url)
+                s.set(from_cache=from_cache)
+            existing = _expected_output(ydl, info, opts) if job.get("skip_existing") else None
+            if existing and os.path.isfile(existing):
+                # playlist entry converted by an earlier run (its flat title did not predict the name)
+                _finish_job(job_id, job, message=f"Já existe: {os.path.basename(existing)}",
+                            extra={"skipped": True}, filepath=existing)
+                return
+            cache_key = output_cache_key(info, opts)
+            cached_path = output_cache.fetch(cache_key, job["outdir"])
+            if cached_path is not None:
+                _finish_job(job_id, job, cached=True, filepath=cached_path)
+                return
+            with _stage("download") as s:
+                _tune_download(ydl, info, tuning)
+                result = _download_from_info(ydl, url, info, from_cache)
+                s.set(**{k: tuning[k] for k in ("host", "concurrent_fragment_downloads") if k in tuning})
+        filepath = _final_filepath(result)
+        if not postprocessors or not filepath:
+            output_cache.store(cache_key, filepath)
+            _finish_job(job_id, job, extra=_job_extra(timings, tuning), filepath=filepath)
+            return
+    except Exception as e:
+        _finish_job(job_id, job, error=e)
+        return
 
+    # Hand the raw audio to the CPU stage and free this download slot right away
+    jobs.update(job_id, status="converting")
+    t_convert = time.perf_counter()
+    trace_ctx = tracing.current()
+    try:
+        fut, position = converter.submit(convert_audio, filepath, postprocessors, opts.get("ffmpeg_location"))
+    except Exception as e:
+        # e.g. the worker processes cannot be started: fail the job instead of leaving it "converting"
+        _finish_job(job_id, job, error=e)
+        return
+    _publish(job_id, {"status": "converting", "stage": "postprocessing", "position": position, "stages": _stage_stats()})
+
+    def on_converted(f):
+        # runs on the pool's result thread: only take the time there
+        finisher.submit(finish_converted, f, time.perf_counter() - t_convert)
+
+    def finish_converted(f, seconds: float):
+        # the span is logged with the job's trace explicitly, as this is not the job's thread
+        error = f.exception()
+        stage_seconds.observe(seconds, stage="postprocess", status="ok" if error is None else "error")
+        tracing.emit("postprocess", seconds, error=error, trace=trace_ctx, queued=position)
         try:
-            response = client.models.generate_content(
-                model=model_name,
-                contents=[types.Content(parts=content_parts)]
-            )
-        except Exception:
-            # Fallback to a default model if the requested one fails
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[types.Content(parts=content_parts)]
-            )
+            converted = f.result()
+            output_cache.store(cache_key, converted)
+            _finish_job(job_id, job, extra=_job_extra(timings, tuning), filepath=converted)
+        except Exception as e:
+            _finish_job(job_id, job, error=e)
 
-        text = response.text
-        if not text:
-            try:
-                text = response.candidates[0].content.parts[0].text
-            except Exception:
-                text = ""
-        
-        return jsonify({"status": "ok", "text": text or ""})
+    fut.add_done_callback(on_converted)
+
+
+def run_transcribe_job(job_id: str, url: str, opts: dict, job: dict):
+    """URL -> transcript: download the native bestaudio stream (no mp3/m4a
+    encode) into a scratch folder and send it straight to the model."""
+    workdir = tempfile.mkdtemp(prefix="voxhub-")
+    download_opts = dict(opts)
+    download_opts["outtmpl"] = os.path.join(workdir, "%(id)s.%(ext)s")
+    timings: dict = {}
+    tuning: dict = {}
+    download_opts["progress_hooks"] = [_progress_hook(job_id, finished_stage="transcribing", timings=timings, tuning=tuning)]
+    try:
+        with ydl_pool.checkout(download_opts) as ydl:
+            with _stage("extract") as s:
+                info, from_cache = _extract_info(ydl, url)
+                s.set(from_cache=from_cache)
+            with _stage("download"):
+                _tune_download(ydl, info, tuning)
+                filepath = _final_filepath(_download_from_info(ydl, url, info, from_cache))
+        if not filepath or not os.path.isfile(filepath):
+            raise RuntimeError("O download não produziu um arquivo de áudio.")
+        jobs.update(job_id, status="transcribing")
+        _publish(job_id, {"status": "transcribing", "stage": "transcribing"})
+        with open(filepath, "rb") as fh:
+            audio_bytes = fh.read()
+        result = _transcribe_audio(
+            _transcription_key(), audio_bytes, mime_for_filename(filepath, "audio/mp4"),
+            job["model"], job["prompt"], path=filepath, normalize=job.get("normalize", False),
+        )
+        result["timings"] = {**timings, **result.get("timings", {})}
+        if tuning:
+            result["tuning"] = tuning
+        _finish_job(job_id, job, message="Transcrição concluída.", extra=result)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        _finish_job(job_id, job, error=e)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _finish_job(job_id: str, job: dict, error: Exception | None = None, cached: bool = False,
+                message: str | None = None, extra: dict | None = None, filepath: str | None = None) -> None:
+    if error is None:
+        message = message or f"Done! Files saved to: {os.path.abspath(job['outdir'])}"
+        ev = {"status": "complete", "message": message, "cached": cached, **(extra or {})}
+        if job.get("profile") or PROFILE_JOBS:
+            # written when the job's worker thread is done, right after this event
+            ev["profile_url"] = f"/profile/{job_id}"
+        fields = {}
+        if filepath and os.path.isfile(filepath):
+            # the output is served by /files/<job_id> while the job is kept
+            fields["filepath"] = os.path.abspath(filepath)
+            ev["file_url"] = f"/files/{job_id}"
+        _finish(job_id, ev, status="done", message=message, **fields)
+    else:
+        message = f"Error: {error}"
+        _finish(job_id, {"status": "error", "message": message}, status="error", message=message)
+
+
+def _publish(job_id: str, ev: dict) -> None:
+    jobs.publish(job_id, ev)
+    _batch_forward(job_id, ev)
+
+
+def _finish(job_id: str, ev: dict, **fields) -> None:
+    jobs.finish(job_id, ev, **fields)
+    jobs_finished.inc(status=_job_outcome(ev))
+    _batch_forward(job_id, ev)
+
+
+def _queue_full(job_id: str) -> None:
+    message = "Fila de conversão cheia. Tente novamente em instantes."
+    _finish(job_id, {"status": "error", "message": message}, status="error", message=message)
+
+
+def _start_job(job_id: str, kind: str | None = None) -> bool:
+    """If the job is pending, hand it to the pool now (lazy execution for serverless).
+
+    False when the download queue has no room: the job is left pending, so
+    the client can be told to retry instead of getting an error event.
+    """
+    # A single job takes its queue slot before the claim, so a burst of streams
+    # cannot all be admitted; a batch queues its items itself as slots free up
+    reserved = kind != "batch"
+    if reserved and not executor.reserve():
+        return False
+    # Several subscribers (maybe in other processes) may open /progress at once;
+    # only the one that claims the job starts it. The options leave the stored job.
+    job = jobs.claim(job_id)
+    if job is None:
+        if reserved:
+            executor.release()
+        return True
+    if job.get("kind") == "batch":
+        _start_batch(job_id, job)
+    else:
+        _submit_job(job_id, job, reserved=True)
+    return True
+
+
+def _submit_job(job_id: str, job: dict, reserved: bool = False) -> bool:
+    """Hand a claimed job to the download pool; False if its queue is full."""
+    def on_start():
+        jobs.update(job_id, status="running")
+        _publish(job_id, {"status": "running"})
+
+    runner = run_transcribe_job if job.get("kind") == "transcribe" else run_job
+    def on_queued(position: int):
+        _publish(job_id, {"status": "queued", "position": position, "stages": _stage_stats()})
+
+    position = executor.submit(_run_traced, runner, job_id, job["url"], job["ydl_opts"], job,
+                               on_start=on_start, on_queued=on_queued, reserved=reserved)
+    return position is not None
+
+
+def _run_traced(runner, job_id: str, url: str, opts: dict, job: dict) -> None:
+    """Run a job on its worker thread with its spans tagged by job id (and batch),
+    under cProfile when the job asked for it."""
+    with tracing.trace(job_id, kind=job.get("kind", "download"), batch=job.get("batch")), \
+            profiler.profile(job_id, job.get("profile") or PROFILE_JOBS), tracing.span("job", url=url):
+        runner(job_id, url, opts, job)
+
+
+def _start_batch(batch_id: str, batch: dict) -> None:
+    """Claim every item of a batch and start the first BATCH_PARALLEL of them.
+
+    Items are claimed up front (so the pending TTL cannot reap the ones still
+    waiting) and then run by this process; their events are folded into the
+    batch stream by `_batch_forward`.
+    """
+    tracker = BatchProgress(batch["items"], parallel=BATCH_PARALLEL)
+    missing = []
+    for item in batch["items"]:
+        if item.get("status") == "skipped":
+            continue
+        job = jobs.claim(item["job_id"])
+        if job is None:
+            missing.append(item["job_id"])
+            continue
+        _batch_jobs[item["job_id"]] = job
+        _batch_of[item["job_id"]] = batch_id
+    batches[batch_id] = tracker
+    jobs.update(batch_id, status="running")
+    jobs.publish(batch_id, {"status": "running", **tracker.summary()})
+    for job_id in missing:
+        # expired, or already started through its own /progress stream
+        ev = tracker.update(job_id, {"status": "error", "message": "Job não encontrado."})
+        jobs.publish(batch_id, ev)
+    _batch_dispatch(batch_id, tracker)
+
+
+def _batch_dispatch(batch_id: str, tracker: BatchProgress) -> None:
+    for job_id in tracker.next_to_start():
+        job = _batch_jobs.get(job_id)
+        if job is None or _submit_job(job_id, job):
+            _batch_jobs.pop(job_id, None)
+        elif not tracker.requeue(job_id):
+            # nothing of this batch is running that would retry it later
+            _batch_jobs.pop(job_id, None)
+            _queue_full(job_id)
+    if tracker.close():
+        summary = tracker.summary()
+        message = f"{summary['completed']} de {summary['total']} concluídos, {summary['failed']} com erro."
+        if summary["skipped"]:
+            message += f" {summary['skipped']} já existiam."
+        jobs.finish(batch_id, {"status": "complete", "message": message, **summary}, status="done", message=message)
+        batches.pop(batch_id, None)
+        batches_finished.inc()
+
+
+def _batch_forward(job_id: str, ev: dict) -> None:
+    """Fold an item job's event into its batch's stream (no-op for standalone jobs)."""
+    batch_id = _batch_of.get(job_id)
+    tracker = batches.get(batch_id) if batch_id else None
+    if tracker is None:
+        return
+    out = tracker.update(job_id, ev)
+    if out is not None:
+        jobs.publish(batch_id, out)
+    if ev.get("status") in ("complete", "error"):
+        _batch_of.pop(job_id, None)
+        _batch_dispatch(batch_id, tracker)
+
+
+def _final_event(job: dict) -> dict:
+    return {"status": job.get("status", "done"), "message": job.get("message", ""), "outdir": job.get("outdir", "downloads")}
+
+
+def _last_event_id(value: str | None) -> int | None:
+    # EventSource sends Last-Event-ID when it reconnects; resume from the current state
+    try:
+        return int(value or "")
+    except ValueError:
+        return None
 
 
-def _sse(data: dict) -> str:
-    return f"data: {json.dumps(data)}\n\n"
+def _open_progress(job_id: str) -> tuple[dict | None, object, bool]:
+    """(job, event channel, busy) for a /progress stream, starting the job if
+    needed. The channel is None if the job is unknown, or if it could not be
+    started because the download queue is full (`busy`)."""
+    job = jobs.get(job_id)
+    if not job:
+        return None, None, False
+    # items of a batch are started by the batch, the stream only follows them
+    if not job.get("batch") and job.get("status") == "pending" and not _start_job(job_id, job.get("kind")):
+        return job, None, True
+    return job, jobs.channel(job_id), False
 
 
 @app.route("/progress/<job_id>")
 def progress(job_id: str):
-    job = jobs.get(job_id)
-    if not job:
+    job, q, busy = _open_progress(job_id)
+    if busy:
+        return _busy_response()
+    if q is None:
         def gen_notfound():
             yield _sse({"status": "error", "message": "Job não encontrado."})
         return Response(gen_notfound(), mimetype="text/event-stream")
 
-    q: queue.Queue = job["queue"]
-
-    # Define the worker function
-    def run_job(job_id: str, url: str, opts: dict, job: dict):
-        def hook(d):
-            status = d.get("status")
-            ev = {"status": status}
-            if status == "downloading":
-                total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
-                downloaded = d.get("downloaded_bytes", 0) or 0
-                ev["total"] = int(total)
-                ev["downloaded"] = int(downloaded)
-                ev["pct"] = (downloaded / total * 100) if total else 0.0
-                ev["eta"] = d.get("eta")
-                ev["speed"] = d.get("speed") or 0
-            elif status == "finished":
-                ev["stage"] = "postprocessing"
-                ev["filename"] = d.get("filename")
-            job["queue"].put(ev)
-
-        job_opts = dict(opts)
-        job_opts["progress_hooks"] = [hook]  # override hooks for SSE
-        try:
-            with YoutubeDL(job_opts) as ydl:
-                ydl.download([url])
-            job["status"] = "done"
-            job["message"] = f"Done! Files saved to: {os.path.abspath(job['outdir'])}"
-            job["queue"].put({"status": "complete", "message": job["message"]})
-        except Exception as e:
-            job["status"] = "error"
-            job["message"] = f"Error: {e}"
-            job["queue"].put({"status": "error", "message": job["message"]})
-        finally:
-            job["queue"].put(None)
-
-    # If job is pending, start it now (Lazy execution for Serverless)
-    if job.get("status") == "pending":
-        job["status"] = "running"
-        threading.Thread(target=run_job, args=(job_id, job["url"], job["ydl_opts"], job), daemon=True).start()
+    last_event_id = _last_event_id(request.headers.get("Last-Event-ID"))
 
     def gen():
-        yield _sse({"status": "start"})
-        while True:
-            try:
-                item = q.get(timeout=10)
-            except queue.Empty:
+        if last_event_id is None:
+            yield "retry: 3000\n" + _sse({"status": "start"})
+        for item in q.events(last_event_id):
+            if item is None:
                 # heartbeat
                 yield ":\n\n"
                 continue
-            if item is None:
-                break
-            yield _sse(item)
-        yield _sse({"status": job.get("status", "done"), "message": job.get("message", ""), "outdir": job.get("outdir", "downloads")})
+            yield _sse(item[1], item[0])
+        yield _sse(_final_event(jobs.get(job_id) or job))
 
     return Response(gen(), mimetype="text/event-stream")
 
 
+@app.route("/files/<job_id>")
+def job_file(job_id: str):
+    """Output file of a finished job.
+
+    send_file hands the open file to the server's `wsgi.file_wrapper` (sendfile
+    under gunicorn and similar) and answers Range, If-Range and If-None-Match
+    with a strong ETag, Content-Length and Last-Modified.
+    """
+    job = jobs.get(job_id)
+    path = (job or {}).get("filepath")
+    if not path or not os.path.isfile(path):
+        return jsonify({"status": "error", "message": "Arquivo não encontrado."}), 404
+    return send_file(
+        path,
+        conditional=True,
+        etag=True,
+        download_name=os.path.basename(path),
+        as_attachment=request.args.get("download") == "1",
+        # a job's output never changes; a later job writing the same name gets a new ETag
+        max_age=3600,
+    )
+
+
+@app.route("/stats")
+def stats():
+    jobs.sweep()
+    return jsonify({"status": "ok", "jobs": jobs.stats(), "sse_subscribers": jobs.subscribers(), "workers": _stage_stats(), "output_cache": output_cache.stats(), "info_cache": info_cache.stats(), "transcript_cache": transcript_cache.stats(), "ydl_pool": ydl_pool.stats(), "batches": len(batches), "upstream": upstream.stats(), "tuner": tuner.stats() if tuner else None})
+
+
+@app.route("/profile/<key>")
+def job_profile(key: str):
+    """cProfile capture of a job or /transcribe request: a pstats text report
+    (`?sort=cumulative|tottime|calls`), or the raw `.prof` file with `?format=prof`
+    (snakeviz, `python -m pstats`)."""
+    path = profiler.path(key)
+    if path is None:
+        return jsonify({"status": "error", "message": "Perfil não encontrado (ainda em execução, expirado ou não solicitado)."}), 404
+    if request.args.get("format") == "prof":
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=f"{key}.prof")
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"status": "error", "message": "sort deve ser cumulative, tottime ou calls."}), 400
+    return Response(profiler.report(key, sort=sort), mimetype="text/plain")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format; per-process values (scrape every worker of a multi-process deploy)
+    return Response(metrics.render(), content_type=metrics.content_type)
+
+
 @app.route("/open_downloads", methods=["POST"])
 def open_downloads():
     if os.environ.get("VERCEL") == "1":
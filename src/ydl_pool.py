@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DEFAULT_OUTTMPL
+
+# Options that change per job and are set on checkout instead of being part of the profile
+PER_JOB_OPTS = ("progress_hooks", "outtmpl")
+
+
+def profile_key(opts: dict) -> str:
+    """Key of an option profile (format, ffmpeg location, headers, ...) without the per-job options."""
+    return json.dumps({k: v for k, v in opts.items() if k not in PER_JOB_OPTS}, sort_keys=True, default=repr)
+
+
+def normalize_outtmpl(opts: dict) -> dict:
+    """The `outtmpl` of `opts` in the form YoutubeDL keeps in its params: a dict
+    of templates by type, missing types filled with yt-dlp's defaults."""
+    outtmpl = opts.get("outtmpl") or {}
+    outtmpl = dict(outtmpl) if isinstance(outtmpl, dict) else {"default": outtmpl}
+    for kind, template in DEFAULT_OUTTMPL.items():
+        if outtmpl.get(kind) is None:
+            if opts.get("restrictfilenames"):
+                template = template.replace(" - ", " ").replace(" ", "-")
+            outtmpl[kind] = template
+    return outtmpl
+
+
+class _JobHooks:
+    """The one progress hook a pooled instance has; it forwards to the hooks
+    of the job that has the instance checked out."""
+
+    def __init__(self):
+        self.hooks: list[Callable] = []
+
+    def __call__(self, d: dict) -> None:
+        for hook in self.hooks:
+            hook(d)
+
+
+class YoutubeDLPool:
+    """Warm `YoutubeDL` instances reused across jobs, keyed by option profile.
+
+    Building a YoutubeDL loads the extractor registry, the cookie jar and a new
+    HTTP session; a pooled instance keeps them, so repeated jobs reuse open
+    connections to the same CDN. Each checkout gets the job's own progress
+    hooks and output template. An instance whose job raised is closed instead
+    of going back to the pool. `max_idle=0` disables pooling.
+
+    Only public YoutubeDL API is used to switch jobs: each instance gets one
+    hook through `add_progress_hook` that forwards to the current job's hooks,
+    and the output template is set in `params`. Whether yt-dlp reported an
+    error without raising is read from `_download_retcode` if it exists; if a
+    yt-dlp version lacks it, instances are not reused.
+    """
+
+    def __init__(self, max_idle: int = 2, factory: Callable[[dict], YoutubeDL] = YoutubeDL):
+        self.max_idle = max(0, int(max_idle))
+        self.factory = factory
+        self._idle: dict[str, list[YoutubeDL]] = {}
+        self._hooks: dict[int, _JobHooks] = {}  # by id() of the instance
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.init_seconds = 0.0
+        self._first_byte: list[float] = []
+
+    def _take(self, key: str) -> YoutubeDL | None:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+        return None
+
+    def _build(self, opts: dict) -> YoutubeDL:
+        t0 = time.perf_counter()
+        ydl = self.factory({k: v for k, v in opts.items() if k != "progress_hooks"})
+        hooks = _JobHooks()
+        ydl.add_progress_hook(hooks)
+        with self._lock:
+            self._hooks[id(ydl)] = hooks
+            self.created += 1
+            self.init_seconds += time.perf_counter() - t0
+        return ydl
+
+    def _prepare(self, ydl: YoutubeDL, opts: dict) -> None:
+        # a new list, so hooks of the previous job never see this one
+        self._hooks[id(ydl)].hooks = list(opts.get("progress_hooks") or [])
+        ydl.params["outtmpl"] = normalize_outtmpl(opts)
+
+    def _close(self, ydl: YoutubeDL) -> None:
+        with self._lock:
+            self._hooks.pop(id(ydl), None)
+        ydl.close()
+
+    def _discard(self, ydl: YoutubeDL) -> None:
+        with self._lock:
+            self.discarded += 1
+        try:
+            self._close(ydl)
+        except Exception:
+            pass
+
+    def _release(self, key: str, ydl: YoutubeDL) -> None:
+        self._hooks[id(ydl)].hooks = []
+        with self._lock:
+            if len(self._idle.get(key, ())) < self.max_idle:
+                self._idle.setdefault(key, []).append(ydl)
+                return
+        self._close(ydl)
+
+    @contextmanager
+    def checkout(self, opts: dict) -> Iterator[YoutubeDL]:
+        """`with pool.checkout(opts) as ydl:` — drop-in for `with YoutubeDL(opts) as ydl:`."""
+        key = profile_key(opts)
+        ydl = self._take(key) or self._build(opts)
+        self._prepare(ydl, opts)
+        try:
+            yield ydl
+        except BaseException:
+            self._discard(ydl)
+            raise
+        if getattr(ydl, "_download_retcode", 1):
+            # yt-dlp reported an error without raising (ignoreerrors), or this version
+            # does not say: start clean next time
+            self._discard(ydl)
+        else:
+            self._release(key, ydl)
+
+    def reset(self) -> None:
+        """Close every idle instance (e.g. after cookies or network settings changed)."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for instances in idle.values():
+            for ydl in instances:
+                self._discard(ydl)
+
+    def note_first_byte(self, seconds: float) -> None:
+        """Record a job's time to first downloaded byte (kept for the last 100 jobs)."""
+        with self._lock:
+            self._first_byte = self._first_byte[-99:] + [seconds]
+
+    def stats(self) -> dict:
+        with self._lock:
+            fb = self._first_byte
+            return {
+                "max_idle": self.max_idle,
+                "profiles": len(self._idle),
+                "idle": sum(len(v) for v in self._idle.values()),
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+                "init_ms_avg": round(self.init_seconds / self.created * 1000, 1) if self.created else 0.0,
+                "first_byte_ms_avg": round(sum(fb) / len(fb) * 1000, 1) if fb else 0.0,
+            }
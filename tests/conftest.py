@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app's modules are flat files in src/, imported by name as web_app.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,35 @@
+import threading
+import time
+
+from job_pool import JobExecutor
+
+
+def test_on_queued_runs_before_on_start_and_outside_the_lock():
+    ex = JobExecutor(workers=1, max_pending=4)
+    events = []
+    stats_seen = []
+
+    def on_queued(position):
+        stats_seen.append(ex.stats())  # would deadlock if submit still held the lock
+        time.sleep(0.2)  # the worker is idle and takes the job meanwhile
+        events.append("queued")
+
+    done = threading.Event()
+    ex.submit(done.set, on_start=lambda: events.append("running"), on_queued=on_queued)
+    assert done.wait(5)
+    assert events == ["queued", "running"]
+    assert stats_seen
+
+
+def test_reserved_slots_count_against_the_queue():
+    ex = JobExecutor(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+    ex.submit(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)  # the only worker is busy
+    assert ex.reserve()
+    assert not ex.reserve()
+    assert ex.is_full()
+    assert ex.submit(print) is None  # the reserved slot is not up for grabs
+    assert ex.submit(lambda: None, reserved=True) is not None
+    release.set()
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+import job_store
+from job_store import LEASE_LOST_MESSAGE, RedisJobStore, SqliteJobStore
+
+# short leases so a "crashed" process is noticed within a couple of seconds
+OPTS = dict(ttl=60, pending_ttl=60, max_rate=100, poll_interval=0.02, lease_ttl=1.0)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_store(request, tmp_path):
+    """Factory of store instances sharing one backend, as separate server processes would."""
+    if request.param == "sqlite":
+        path = str(tmp_path / "jobs.sqlite3")
+        return lambda: SqliteJobStore(path, **OPTS)
+    if job_store.redis is None:
+        pytest.skip("redis package not installed")
+    url = os.environ.get("TEST_REDIS_URL")  # a real server, e.g. redis://localhost:6379/15
+    if url:
+        prefix = f"voxhub-test-{uuid.uuid4().hex[:8]}:"
+        return lambda: RedisJobStore(url, prefix=prefix, **OPTS)
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+
+    def build():
+        store = RedisJobStore("redis://localhost:6379/0", **OPTS)
+        store.r = fakeredis.FakeRedis(server=server)
+        return store
+    return build
+
+
+def new_job(store) -> str:
+    job_id = uuid.uuid4().hex
+    store.create(job_id, {"status": "pending", "url": "http://example.com/a", "ydl_opts": {"format": "bestaudio"}})
+    return job_id
+
+
+def read_events(channel, timeout: float = 10.0) -> list[dict]:
+    """Events of a channel until it closes (fails the test after `timeout`)."""
+    deadline = time.monotonic() + timeout
+    out = []
+    for item in channel.events(heartbeat=0.05):
+        if item is not None:
+            out.append(item[1])
+        assert time.monotonic() < deadline, f"stream did not close, got {out}"
+    return out
+
+
+def test_claim_is_exclusive(make_store):
+    stores = [make_store() for _ in range(2)]
+    job_id = new_job(stores[0])
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim(store):
+        barrier.wait()
+        results.append(store.claim(job_id))
+
+    threads = [threading.Thread(target=claim, args=(stores[n % 2],)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    won = [r for r in results if r is not None]
+    assert len(won) == 1
+    assert won[0]["status"] == "queued" and won[0]["ydl_opts"] == {"format": "bestaudio"}
+    stored = stores[1].get(job_id)
+    assert stored["status"] == "queued" and "ydl_opts" not in stored
+
+
+def test_events_are_followed_from_another_instance(make_store):
+    runner, watcher = make_store(), make_store()
+    job_id = new_job(runner)
+    assert runner.claim(job_id) is not None
+    channel = watcher.channel(job_id)
+    runner.publish(job_id, {"status": "running"})
+    runner.publish(job_id, {"status": "downloading", "percent": 50})
+    runner.finish(job_id, {"status": "complete", "message": "ok"}, status="done", message="ok")
+    events = read_events(channel)
+    assert [ev["status"] for ev in events] == ["running", "downloading", "complete"]
+    assert watcher.get(job_id)["status"] == "done"
+
+
+def test_job_of_a_dead_process_fails_when_its_lease_lapses(make_store):
+    runner, watcher = make_store(), make_store()
+    dead, alive = new_job(runner), new_job(runner)
+    runner.claim(dead)
+    runner.claim(alive)
+    runner.publish(dead, {"status": "running"})
+    runner._owned.discard(dead)  # its process "crashed": nobody renews the lease any more
+    events = read_events(watcher.channel(dead))
+    assert events[-1] == {"status": "error", "message": LEASE_LOST_MESSAGE}
+    assert watcher.get(dead)["status"] == "error"
+    # the job whose process is still renewing its lease is left alone
+    assert watcher.sweep() >= 0
+    assert watcher.get(alive)["status"] == "queued"
+    assert watcher.reaped == 1
+
+
+def test_sweep_fails_lapsed_jobs_nobody_watches(make_store):
+    runner, other = make_store(), make_store()
+    job_id = new_job(runner)
+    runner.claim(job_id)
+    runner._owned.discard(job_id)
+    time.sleep(OPTS["lease_ttl"] + 1.1)
+    other.sweep()
+    assert other.get(job_id)["status"] == "error"
+    # exactly one process takes a lapsed job over
+    assert runner._reap() == 0 and other.reaped == 1
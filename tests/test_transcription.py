@@ -0,0 +1,122 @@
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+import transcription
+from transcription import plan_windows, stitch_transcripts, transcribe_long_file
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+class FakeModels:
+    """`client.models` whose transcript of a window is looked up by the
+    window's audio bytes (see `fake_windows`)."""
+
+    def __init__(self, transcripts: dict[bytes, str], fail_model: str | None = None):
+        self.transcripts = transcripts
+        self.fail_model = fail_model
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents):
+        part = contents[0]["parts"][0] if isinstance(contents[0], dict) else contents[0].parts[0]
+        data = part["inline_data"]["data"] if isinstance(part, dict) else part.inline_data.data
+        with self._lock:
+            self.calls.append((model, data))
+        if model == self.fail_model:
+            raise RuntimeError("model unavailable")
+        return type("Response", (), {"text": self.transcripts[data]})()
+
+
+class FakeClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+def words(start: int, stop: int) -> str:
+    return " ".join(f"w{i}" for i in range(start, stop))
+
+
+@pytest.fixture
+def fake_windows(monkeypatch):
+    """No ffmpeg: the file lasts `duration` seconds and a window's bytes are its start time."""
+    def install(duration: float):
+        monkeypatch.setattr(transcription, "probe_duration", lambda path, ffmpeg="ffmpeg": duration)
+        monkeypatch.setattr(transcription, "extract_window",
+                            lambda path, start, length, ffmpeg="ffmpeg": f"{start:.0f}".encode())
+    return install
+
+
+def test_plan_windows_overlap_and_last_window():
+    assert plan_windows(25, 10, 2) == [(0.0, 10.0), (8.0, 10.0), (16.0, 9.0)]
+    assert plan_windows(5, 10, 2) == [(0.0, 5)]
+    # the overlap is capped at half a window
+    assert plan_windows(20, 10, 8) == [(0.0, 10.0), (5.0, 10.0), (10.0, 10.0)]
+
+
+def test_stitch_drops_the_overlap():
+    assert stitch_transcripts([words(0, 40), words(30, 70), words(60, 90)]) == words(0, 90)
+
+
+def test_stitch_drops_words_cut_at_the_window_edge():
+    first = words(0, 40) + " hal"
+    second = "f-word " + words(35, 60)
+    assert stitch_transcripts([first, second]) == words(0, 60)
+
+
+def test_stitch_ignores_a_phrase_repeated_away_from_the_edges():
+    first = words(0, 30) + " in the world " + words(30, 70)
+    second = words(100, 110) + " in the world " + words(110, 140)
+    out = stitch_transcripts([first, second]).split()
+    assert len(out) == len(first.split()) + len(second.split())
+
+
+def test_stitch_skips_empty_windows():
+    assert stitch_transcripts(["", words(0, 5), "  ", words(3, 8)], min_match=2) == words(0, 8)
+
+
+def test_transcribe_long_file_stitches_windows_in_order(fake_windows):
+    fake_windows(25)
+    # ~3 words per second; each window repeats the words of its overlap
+    models = FakeModels({b"0": words(0, 30), b"8": words(24, 54), b"16": words(48, 75)})
+    text, n = transcribe_long_file(FakeClient(models), "m", "audio.webm", "p", window=10, overlap=2, max_workers=3)
+    assert n == 3
+    assert text == words(0, 75)
+    assert sorted(data for _, data in models.calls) == [b"0", b"16", b"8"]
+
+
+def test_transcribe_long_file_falls_back_per_window(fake_windows):
+    fake_windows(15)
+    models = FakeModels({b"0": words(0, 30), b"8": words(24, 45)}, fail_model="m")
+    fallbacks = []
+    text, n = transcribe_long_file(FakeClient(models), "m", "audio.webm", "p", window=10, overlap=2,
+                                   on_fallback=lambda model, e: fallbacks.append(model))
+    assert (text, n) == (words(0, 45), 2)
+    assert fallbacks == ["m", "m"]
+    assert {model for model, _ in models.calls} == {"m", transcription.FALLBACK_MODEL}
+
+
+@pytest.mark.skipif(FFMPEG is None, reason="ffmpeg not installed")
+def test_probe_duration_of_webm_without_duration(tmp_path):
+    # piped WebM has no duration in its header, like MediaRecorder output
+    path = tmp_path / "rec.webm"
+    with open(path, "wb") as fh:
+        subprocess.run([FFMPEG, "-v", "error", "-f", "lavfi", "-i", "sine=duration=3", "-c:a", "libopus",
+                        "-f", "webm", "pipe:1"], stdout=fh, check=True)
+    header = subprocess.run([FFMPEG, "-hide_banner", "-i", str(path)], capture_output=True, text=True).stderr
+    assert "Duration: N/A" in header
+    assert transcription.probe_duration(str(path), FFMPEG) == pytest.approx(3.0, abs=0.1)
+
+
+def test_shared_client_passes_pool_limits_to_the_async_client():
+    if transcription.types is None:
+        pytest.skip("google-genai not installed")
+    pytest.importorskip("httpx")
+    options = transcription.SharedClient(None, max_connections=3, keepalive=30)._http_options()
+    assert options.client_args["limits"].max_connections == 3
+    if options.async_client_args is None:
+        assert transcription.importlib.util.find_spec("aiohttp") is not None  # the SDK uses aiohttp then
+    else:
+        assert options.async_client_args["limits"].max_connections == 3
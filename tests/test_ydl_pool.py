@@ -0,0 +1,56 @@
+from yt_dlp import YoutubeDL
+
+from ydl_pool import YoutubeDLPool, normalize_outtmpl
+
+
+class FakeYDL:
+    """Only the public YoutubeDL surface the pool touches."""
+
+    def __init__(self, params):
+        self.params = dict(params)
+        self.hooks = []
+        self._download_retcode = 0
+        self.closed = False
+
+    def add_progress_hook(self, hook):
+        self.hooks.append(hook)
+
+    def report(self, status):
+        for hook in self.hooks:
+            hook({"status": status})
+
+    def close(self):
+        self.closed = True
+
+
+def test_normalize_outtmpl_matches_youtubedl():
+    for opts in ({}, {"outtmpl": "/tmp/x/%(id)s.%(ext)s"},
+                 {"outtmpl": {"default": "a.%(ext)s"}, "restrictfilenames": True}):
+        with YoutubeDL({**opts, "quiet": True}) as ydl:
+            assert normalize_outtmpl(opts) == ydl.params["outtmpl"]
+
+
+def test_reused_instance_reports_to_the_current_job_only():
+    pool = YoutubeDLPool(max_idle=1, factory=FakeYDL)
+    first, second = [], []
+    with pool.checkout({"format": "bestaudio", "outtmpl": "a/%(id)s", "progress_hooks": [first.append]}) as ydl:
+        ydl.report("downloading")
+    with pool.checkout({"format": "bestaudio", "outtmpl": "b/%(id)s", "progress_hooks": [second.append]}) as again:
+        assert again is ydl
+        assert again.params["outtmpl"]["default"] == "b/%(id)s"
+        again.report("finished")
+    assert first == [{"status": "downloading"}]
+    assert second == [{"status": "finished"}]
+    assert len(ydl.hooks) == 1
+    assert pool.stats()["reused"] == 1
+
+
+def test_instance_that_reported_an_error_is_not_reused():
+    pool = YoutubeDLPool(max_idle=1, factory=FakeYDL)
+    with pool.checkout({}) as ydl:
+        ydl._download_retcode = 1
+    assert ydl.closed
+    with pool.checkout({}) as other:
+        del other._download_retcode  # a yt-dlp without the attribute
+    assert other is not ydl and other.closed
+    assert pool.stats()["discarded"] == 2